@@ -0,0 +1,15 @@
+"""
+Benchmarks for rply. Every ``bench_*`` module can be run on its own, with
+``python -m benchmarks.bench_lex`` for example, and has a `measure` function
+returning a list of ``(name, value, unit)`` tuples, which
+:mod:`benchmarks.run` compares with a stored baseline.
+"""
+import timeit
+
+
+def best_time(func, repeat=5):
+    """
+    Returns the fastest of `repeat` calls of `func` in seconds, which is the
+    one least disturbed by whatever else the machine was doing.
+    """
+    return min(timeit.repeat(func, number=1, repeat=repeat))
@@ -0,0 +1,46 @@
+"""
+Measures how long building the parser for grammars of increasing size takes.
+
+Run with ``python -m benchmarks.bench_build`` from the root of the
+repository.
+"""
+import warnings
+
+from benchmarks import best_time
+from benchmarks.grammars import make_parser_generator
+
+from rply import ParserGenerator
+
+
+SIZES = [0, 25, 50, 100]
+
+
+def measure():
+    warnings.simplefilter("ignore")
+    results = []
+    for statement_kinds in SIZES:
+        pg = make_parser_generator(statement_kinds)
+
+        def build():
+            # Tables built before must not be reused.
+            ParserGenerator.table_cache.invalidate()
+            return pg.build()
+        parser = build()
+        results.append((
+            "build %d productions, %d states" % (
+                len(parser.lr_table.grammar.productions),
+                len(parser.lr_table.lr_action),
+            ),
+            best_time(build, repeat=3),
+            "s",
+        ))
+    return results
+
+
+def main():
+    for name, value, unit in measure():
+        print("%-44s %12.6f %s" % (name, value, unit))
+
+
+if __name__ == "__main__":
+    main()
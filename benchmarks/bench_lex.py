@@ -0,0 +1,32 @@
+"""
+Measures how fast lexers with few and with many rules produce tokens.
+
+Run with ``python -m benchmarks.bench_lex`` from the root of the repository.
+"""
+from benchmarks import best_time
+from benchmarks.grammars import SOURCE, make_lexer_generator
+
+
+TEXT = SOURCE * 200
+
+# Every statement kind adds a keyword rule.
+RULE_SETS = [("few rules", 0), ("many rules", 200)]
+
+
+def measure():
+    results = []
+    for name, statement_kinds in RULE_SETS:
+        lexer = make_lexer_generator(statement_kinds).build()
+        ntokens = sum(1 for _ in lexer.lex(TEXT))
+        seconds = best_time(lambda: sum(1 for _ in lexer.lex(TEXT)))
+        results.append(("lex %d tokens, %s" % (ntokens, name), seconds, "s"))
+    return results
+
+
+def main():
+    for name, value, unit in measure():
+        print("%-44s %12.6f %s" % (name, value, unit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Measures how many bytes a lexed token takes, while it's kept alive.
+
+Run with ``python -m benchmarks.bench_memory`` from the root of the
+repository. Needs :mod:`tracemalloc`, which is available on Python 3.4 and
+newer.
+"""
+import gc
+import tracemalloc
+
+from rply import LexerGenerator
+
+
+SOURCE = 'foo = bar(12, "abc") + baz * 3.5\n' * 20000
+
+
+class DictSourcePosition(object):
+    """
+    The representation :class:`rply.token.SourcePosition` had before it used
+    ``__slots__``.
+    """
+    def __init__(self, idx, lineno, colno):
+        self.idx = idx
+        self.lineno = lineno
+        self.colno = colno
+
+
+class DictToken(object):
+    """
+    The representation :class:`rply.Token` had before it used ``__slots__``.
+    """
+    def __init__(self, name, value, source_pos=None):
+        self.name = name
+        self.value = value
+        self.source_pos = source_pos
+
+
+def build_lexer(**kwargs):
+    lg = LexerGenerator()
+    lg.add("NUMBER", r"\d+(\.\d+)?")
+    lg.add("STRING", r'"[^"]*"')
+    lg.add("NAME", r"[a-zA-Z_]\w*")
+    lg.add("OP", r"[-+*/=(),]")
+    lg.ignore(r"\s+")
+    return lg.build(**kwargs)
+
+
+def measure_tokens(make_tokens):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tokens = make_tokens()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / float(len(tokens))
+
+
+def dict_tokens():
+    return [
+        DictToken(t.name, t.value, DictSourcePosition(
+            t.source_pos.idx, t.source_pos.lineno, t.source_pos.colno
+        ))
+        for t in build_lexer().lex(SOURCE)
+    ]
+
+
+def slotted_tokens():
+    return list(build_lexer().lex(SOURCE))
+
+
+def lazy_tokens():
+    return list(build_lexer(lazy_positions=True).lex(SOURCE))
+
+
+def measure():
+    return [
+        ("memory per token", measure_tokens(slotted_tokens), "bytes"),
+        (
+            "memory per token, lazy positions",
+            measure_tokens(lazy_tokens),
+            "bytes",
+        ),
+    ]
+
+
+def main():
+    for name, func in [
+        ("__dict__ tokens (before)", dict_tokens),
+        ("__slots__ tokens", slotted_tokens),
+        ("__slots__ tokens, lazy positions", lazy_tokens),
+    ]:
+        print("%-34s %6.1f bytes/token" % (name, measure_tokens(func)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Measures how fast parsers for arithmetic expressions and JSON consume tokens.
+The input is lexed beforehand, so that only the parser is measured.
+
+Run with ``python -m benchmarks.bench_parse`` from the root of the
+repository.
+"""
+from benchmarks import best_time
+from benchmarks.grammars import (
+    ARITHMETIC_SOURCE, JSON_SOURCE, make_arithmetic_generators,
+    make_json_generators
+)
+
+
+def measure():
+    results = []
+    for name, make_generators, source in [
+        ("arithmetic", make_arithmetic_generators, ARITHMETIC_SOURCE),
+        ("json", make_json_generators, JSON_SOURCE),
+    ]:
+        lg, pg = make_generators()
+        parser = pg.build()
+        tokens = list(lg.build().lex(source))
+        seconds = best_time(lambda: parser.parse(iter(tokens)))
+        results.append((
+            "parse %d tokens, %s" % (len(tokens), name), seconds, "s"
+        ))
+    return results
+
+
+def main():
+    for name, value, unit in measure():
+        print("%-44s %12.6f %s" % (name, value, unit))
+
+
+if __name__ == "__main__":
+    main()
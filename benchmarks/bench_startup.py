@@ -0,0 +1,134 @@
+"""
+Compares how long loading a cached parser table takes with the JSON format
+rply used to write, with the binary format it writes now and by mapping the
+file :meth:`~rply.ParserGenerator.build_mapped` writes.
+
+Run with ``python -m benchmarks.bench_startup`` from the root of the
+repository.
+"""
+import json
+import os
+import shutil
+import tempfile
+import warnings
+
+from benchmarks import best_time
+from benchmarks.grammars import make_parser_generator
+
+from rply.parsergenerator import LRTable, MappedLRTable
+from rply.utils import iteritems
+
+
+STATEMENT_KINDS = 60
+
+
+def serialize_table(table):
+    # The JSON format rply used to cache tables in.
+    return {
+        "lr_action": table.lr_action,
+        "lr_goto": table.lr_goto,
+        "sr_conflicts": table.sr_conflicts,
+        "rr_conflicts": table.rr_conflicts,
+        "default_reductions": table.default_reductions,
+        "start": table.grammar.start,
+        "terminals": sorted(table.grammar.terminals),
+        "precedence": table.grammar.precedence,
+        "productions": [
+            (p.name, p.prod, p.prec) for p in table.grammar.productions
+        ],
+    }
+
+
+def data_is_valid(g, data):
+    if g.start != data["start"]:
+        return False
+    if sorted(g.terminals) != data["terminals"]:
+        return False
+    if sorted(g.precedence) != sorted(data["precedence"]):
+        return False
+    for key, (assoc, level) in iteritems(g.precedence):
+        if data["precedence"][key] != [assoc, level]:
+            return False
+    if len(g.productions) != len(data["productions"]):
+        return False
+    for p, (name, prod, (assoc, level)) in zip(
+        g.productions, data["productions"]
+    ):
+        if p.name != name:
+            return False
+        if p.prod != prod:
+            return False
+        if p.prec != (assoc, level):
+            return False
+    return True
+
+
+def load_json_table(g, data):
+    lr_action = [
+        dict([(str(k), v) for k, v in iteritems(action)])
+        for action in data["lr_action"]
+    ]
+    lr_goto = [
+        dict([(str(k), v) for k, v in iteritems(goto)])
+        for goto in data["lr_goto"]
+    ]
+    return LRTable(
+        g,
+        lr_action,
+        lr_goto,
+        data["default_reductions"],
+        data["sr_conflicts"],
+        data["rr_conflicts"]
+    )
+
+
+def measure():
+    warnings.simplefilter("ignore")
+    pg = make_parser_generator(STATEMENT_KINDS)
+    table = pg.build().lr_table
+    g = table.grammar
+    grammar_hash = pg.compute_grammar_hash(g)
+
+    json_data = json.dumps(serialize_table(table))
+    binary_data = pg.serialize_packed_table(table, grammar_hash)
+
+    def load_json():
+        data = json.loads(json_data)
+        assert data_is_valid(g, data)
+        return load_json_table(g, data)
+
+    def load_binary():
+        return pg.load_packed_table(g, grammar_hash, binary_data)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, "tables")
+        with open(path, "wb") as f:
+            f.write(pg.serialize_mapped_table(table, grammar_hash))
+
+        def open_mapped():
+            return MappedLRTable.open(g, path, grammar_hash)
+
+        results = []
+        for name, func in [
+            ("load cached table, json", load_json),
+            ("load cached table, binary", load_binary),
+            ("open mapped table", open_mapped),
+        ]:
+            results.append((
+                "%s, %d states" % (name, len(table.lr_action)),
+                best_time(func, repeat=10),
+                "s",
+            ))
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    for name, value, unit in measure():
+        print("%-44s %12.6f %s" % (name, value, unit))
+
+
+if __name__ == "__main__":
+    main()
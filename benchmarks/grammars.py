@@ -0,0 +1,251 @@
+"""
+Grammars shared by the benchmarks.
+"""
+from rply import LexerGenerator, ParserGenerator
+
+
+OPERATORS = [
+    ("left", ["OR"]),
+    ("left", ["AND"]),
+    ("left", ["EQ", "NE", "LT", "GT", "LE", "GE"]),
+    ("left", ["PLUS", "MINUS"]),
+    ("left", ["MUL", "DIV", "MOD"]),
+]
+
+PUNCTUATION = [
+    ("LPAREN", r"\("), ("RPAREN", r"\)"), ("LBRACE", r"\{"),
+    ("RBRACE", r"\}"), ("LBRACKET", r"\["), ("RBRACKET", r"\]"),
+    ("COMMA", r","), ("SEMI", r";"), ("DOT", r"\."),
+    ("EQ", r"=="), ("NE", r"!="), ("LE", r"<="), ("GE", r">="),
+    ("ASSIGN", r"="), ("LT", r"<"), ("GT", r">"), ("OR", r"\|\|"),
+    ("AND", r"&&"), ("PLUS", r"\+"), ("MINUS", r"-"), ("MUL", r"\*"),
+    ("DIV", r"/"), ("MOD", r"%"),
+]
+
+RULES = [
+    "program : stmts",
+    "stmts : stmts stmt",
+    "stmts : stmt",
+    "block : LBRACE stmts RBRACE",
+    "block : LBRACE RBRACE",
+    "stmt : expr SEMI",
+    "stmt : target ASSIGN expr SEMI",
+    "stmt : IF LPAREN expr RPAREN block",
+    "stmt : IF LPAREN expr RPAREN block ELSE block",
+    "stmt : WHILE LPAREN expr RPAREN block",
+    "stmt : RETURN expr SEMI",
+    "stmt : RETURN SEMI",
+    "stmt : DEF NAME LPAREN params RPAREN block",
+    "target : NAME",
+    "target : primary DOT NAME",
+    "target : primary LBRACKET expr RBRACKET",
+    "params : ",
+    "params : param_list",
+    "param_list : NAME",
+    "param_list : param_list COMMA NAME",
+    "args : ",
+    "args : arg_list",
+    "arg_list : expr",
+    "arg_list : arg_list COMMA expr",
+    "expr : primary",
+    "expr : MINUS expr",
+    "primary : NUMBER",
+    "primary : STRING",
+    "primary : NAME",
+    "primary : LPAREN expr RPAREN",
+    "primary : LBRACKET args RBRACKET",
+    "primary : primary LPAREN args RPAREN",
+    "primary : primary DOT NAME",
+    "primary : primary LBRACKET expr RBRACKET",
+] + [
+    "expr : expr %s expr" % op for _, ops in OPERATORS for op in ops
+]
+
+KEYWORDS = ["IF", "ELSE", "WHILE", "RETURN", "DEF"]
+
+
+def identity(p):
+    return p[0] if p else None
+
+
+def make_parser_generator(statement_kinds=0, cache_id=None):
+    """
+    Returns a ParserGenerator for a small programming language. Every one of
+    the `statement_kinds` adds a keyword and a few statements using it, which
+    makes the grammar arbitrarily large.
+    """
+    keywords = KEYWORDS + ["KW%d" % i for i in range(statement_kinds)]
+    tokens = keywords + ["NUMBER", "STRING", "NAME"]
+    tokens += [name for name, _ in PUNCTUATION]
+    pg = ParserGenerator(tokens, precedence=OPERATORS, cache_id=cache_id)
+    rules = list(RULES)
+    for i in range(statement_kinds):
+        rules.extend([
+            "stmt : KW%d LPAREN args RPAREN block" % i,
+            "stmt : KW%d NAME ASSIGN expr SEMI" % i,
+            "stmt : KW%d expr block ELSE block" % i,
+        ])
+    for rule in rules:
+        pg.production(rule)(identity)
+    return pg
+
+
+def make_lexer_generator(statement_kinds=0):
+    lg = LexerGenerator()
+    for keyword in KEYWORDS + ["KW%d" % i for i in range(statement_kinds)]:
+        lg.add(keyword, r"%s\b" % keyword.lower())
+    lg.add("NUMBER", r"\d+")
+    lg.add("STRING", r'"[^"]*"')
+    lg.add("NAME", r"[a-zA-Z_]\w*")
+    for name, pattern in PUNCTUATION:
+        lg.add(name, pattern)
+    lg.ignore(r"\s+")
+    lg.ignore(r"#[^\n]*")
+    return lg
+
+
+SOURCE = """\
+def fib(n) {
+    # naive recursion
+    if (n < 2) { return n; }
+    return fib(n - 1) + fib(n - 2);
+}
+def main() {
+    xs = [1, 2, 3, "four"];
+    i = 0;
+    while (i <= 10 && xs[0] != 7 || i == 3) {
+        total = total + fib(i) * 2 % 5 / 1;
+        obj.field = -i;
+        i = i + 1;
+    }
+    return total;
+}
+"""
+
+
+def make_arithmetic_generators():
+    """
+    Returns a LexerGenerator and ParserGenerator for arithmetic expressions,
+    which produce a value for every reduction, like an interpreter would.
+    """
+    lg = LexerGenerator()
+    lg.add("NUMBER", r"\d+")
+    lg.add("PLUS", r"\+")
+    lg.add("MINUS", r"-")
+    lg.add("MUL", r"\*")
+    lg.add("DIV", r"/")
+    lg.add("LPAREN", r"\(")
+    lg.add("RPAREN", r"\)")
+    lg.ignore(r"\s+")
+
+    pg = ParserGenerator(
+        ["NUMBER", "PLUS", "MINUS", "MUL", "DIV", "LPAREN", "RPAREN"],
+        precedence=[("left", ["PLUS", "MINUS"]), ("left", ["MUL", "DIV"])],
+    )
+
+    @pg.production("main : expr")
+    def main(p):
+        return p[0]
+
+    @pg.production("expr : LPAREN expr RPAREN")
+    def paren(p):
+        return p[1]
+
+    @pg.production("expr : expr PLUS expr")
+    @pg.production("expr : expr MINUS expr")
+    @pg.production("expr : expr MUL expr")
+    @pg.production("expr : expr DIV expr")
+    def binop(p):
+        return (p[1].getstr(), p[0], p[2])
+
+    @pg.production("expr : NUMBER")
+    def number(p):
+        return int(p[0].getstr())
+
+    return lg, pg
+
+
+ARITHMETIC_SOURCE = " + ".join(
+    ["(%d * %d - %d) / 7" % (i, i + 1, i + 2) for i in range(2000)]
+)
+
+
+def make_json_generators():
+    """
+    Returns a LexerGenerator and ParserGenerator for JSON, which build the
+    lists and dicts it describes.
+    """
+    lg = LexerGenerator()
+    lg.add("STRING", r'"(\\.|[^"\\])*"')
+    lg.add("NUMBER", r"-?\d+(\.\d+)?([eE][-+]?\d+)?")
+    lg.add("TRUE", r"true\b")
+    lg.add("FALSE", r"false\b")
+    lg.add("NULL", r"null\b")
+    lg.add("LBRACE", r"\{")
+    lg.add("RBRACE", r"\}")
+    lg.add("LBRACKET", r"\[")
+    lg.add("RBRACKET", r"\]")
+    lg.add("COLON", r":")
+    lg.add("COMMA", r",")
+    lg.ignore(r"\s+")
+
+    pg = ParserGenerator([
+        "STRING", "NUMBER", "TRUE", "FALSE", "NULL", "LBRACE", "RBRACE",
+        "LBRACKET", "RBRACKET", "COLON", "COMMA",
+    ])
+
+    @pg.production("value : object")
+    @pg.production("value : array")
+    def value_container(p):
+        return p[0]
+
+    @pg.production("value : STRING")
+    def value_string(p):
+        return p[0].getstr()[1:-1]
+
+    @pg.production("value : NUMBER")
+    def value_number(p):
+        return float(p[0].getstr())
+
+    @pg.production("value : TRUE")
+    @pg.production("value : FALSE")
+    @pg.production("value : NULL")
+    def value_constant(p):
+        return {"true": True, "false": False, "null": None}[p[0].getstr()]
+
+    @pg.production("object : LBRACE RBRACE")
+    @pg.production("array : LBRACKET RBRACKET")
+    def empty(p):
+        return {} if p[0].gettokentype() == "LBRACE" else []
+
+    @pg.production("object : LBRACE members RBRACE")
+    def object_members(p):
+        return dict(p[1])
+
+    @pg.production("members : member")
+    @pg.production("elements : value")
+    def first(p):
+        return [p[0]]
+
+    @pg.production("members : members COMMA member")
+    @pg.production("elements : elements COMMA value")
+    def more(p):
+        p[0].append(p[2])
+        return p[0]
+
+    @pg.production("member : STRING COLON value")
+    def member(p):
+        return (p[0].getstr()[1:-1], p[2])
+
+    @pg.production("array : LBRACKET elements RBRACKET")
+    def array_elements(p):
+        return p[1]
+
+    return lg, pg
+
+
+JSON_SOURCE = "[%s]" % ", ".join([
+    '{"id": %d, "name": "item %d", "price": %d.5, "tags": ["a", "b"], '
+    '"active": true, "parent": null}' % (i, i, i)
+    for i in range(1000)
+])
@@ -0,0 +1,100 @@
+"""
+Runs all benchmarks and compares their results with a baseline, to catch
+regressions.
+
+Run with ``python -m benchmarks.run`` from the root of the repository. The
+first run, and every run with ``--save``, stores its results as the
+baseline in ``.benchmarks/baseline.json``, which isn't checked in, because
+timings are only comparable on the machine they were taken on. Later runs
+print how much every result changed and exit with status 1 if any got worse
+than the baseline by more than the threshold. All results are times or
+sizes, so higher is worse.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+
+
+BENCHMARKS = [
+    "benchmarks.bench_lex",
+    "benchmarks.bench_parse",
+    "benchmarks.bench_build",
+    "benchmarks.bench_startup",
+    "benchmarks.bench_memory",
+]
+
+BASELINE = os.path.join(".benchmarks", "baseline.json")
+
+
+def run(names):
+    results = []
+    for name in names:
+        try:
+            module = importlib.import_module(name)
+        except ImportError as e:
+            # bench_memory needs tracemalloc, which Python 2 doesn't have.
+            print("skipping %s: %s" % (name, e))
+            continue
+        results.extend(module.measure())
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--save", action="store_true",
+        help="store the results as the new baseline",
+    )
+    parser.add_argument(
+        "--baseline", default=BASELINE,
+        help="the file the baseline is stored in (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.25,
+        help="the relative change considered a regression (default: 0.25)",
+    )
+    parser.add_argument(
+        "benchmarks", nargs="*", default=BENCHMARKS,
+        help="the benchmark modules to run (default: all of them)",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(args.benchmarks)
+    regressions = 0
+    for name, value, unit in results:
+        if name in baseline and baseline[name]:
+            change = value / baseline[name] - 1
+            if change > args.threshold:
+                regressions += 1
+                note = "REGRESSION"
+            else:
+                note = ""
+            print("%-44s %12.6f %-5s %+7.1f%% %s" % (
+                name, value, unit, change * 100, note
+            ))
+        else:
+            print("%-44s %12.6f %-5s" % (name, value, unit))
+
+    if args.save or not baseline:
+        directory = os.path.dirname(args.baseline)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        baseline.update([(name, value) for name, value, _ in results])
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("baseline saved to %s" % args.baseline)
+    elif regressions:
+        print("%d regression%s" % (regressions, "s" if regressions > 1 else ""))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
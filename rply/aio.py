@@ -0,0 +1,39 @@
+"""
+Support for lexing and parsing with :mod:`asyncio`. This module uses syntax
+introduced in Python 3.5 and is only imported when its functionality is used.
+"""
+from rply.lexer import ChunkedLexerStream
+
+
+class AsyncLexerStream(ChunkedLexerStream):
+    """
+    Lexes a reader like :class:`~rply.lexer.ChunkedLexerStream` lexes a file,
+    except that tokens are returned as soon as the data read so far contains
+    them completely, instead of waiting for `chunk_size` characters of
+    lookahead, which may never arrive on a connection that stays open.
+    """
+    def __init__(self, lexer, reader, chunk_size):
+        ChunkedLexerStream.__init__(self, lexer, reader, chunk_size)
+        self.wait_for_lookahead = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            try:
+                token = self._step()
+            except StopIteration:
+                raise StopAsyncIteration
+            if token is not None:
+                return token
+            self._refill(await self.fileobj.read(self._wanted))
+
+
+async def parse_async(parser, tokenizer, state=None, errors=None):
+    session = parser.start(state, errors)
+    async for token in tokenizer:
+        if token is None:
+            break
+        session.feed(token)
+    return session.finish()
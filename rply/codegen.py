@@ -0,0 +1,358 @@
+from rply.dfa import DFA
+from rply.errors import LexerGeneratorError
+from rply.lexer import CombinedLexer
+from rply.utils import text_type
+
+
+PARSER_TEMPLATE = '''\
+# This module was generated by rply from a ParserGenerator, don't edit it.
+from rply.codegen import grammar_signature
+from rply.errors import ParserGeneratorError, ParsingError
+from rply.token import Token, TokenBatch
+
+
+%(constants)s
+
+
+def build(pg):
+    """
+    Returns a parser, which calls the productions of the ParserGenerator `pg`,
+    without analyzing its grammar. The grammar must be the one this module
+    was generated from.
+    """
+    if grammar_signature(pg) != (TOKENS, PRECEDENCE, PRODUCTIONS):
+        raise ParserGeneratorError(
+            "The grammar doesn't match the one the parser was generated from"
+        )
+    funcs = [None] + [func for _, _, func, _ in pg.productions]
+    return Parser(funcs, pg.error_handler)
+
+
+class Parser(object):
+    def __init__(self, funcs, error_handler):
+        self.funcs = funcs
+        self.error_handler = error_handler
+
+    def parse(self, tokenizer, state=None, errors=None):
+        if isinstance(tokenizer, TokenBatch):
+            tokenizer = iter(tokenizer)
+        if errors is None:
+            errors = []
+
+        funcs = self.funcs
+        symstack = [Token("$end", "$end")]
+        statestack = [0]
+        current_state = 0
+        lookahead = None
+        tid = -1
+        # [tokens left to shift until recovered, the token shifted as error]
+        recovery = [0, None]
+        while True:
+            t = DEFAULT_REDUCTIONS[current_state]
+            if not t:
+                if lookahead is None:
+                    try:
+                        lookahead = next(tokenizer)
+                    except StopIteration:
+                        lookahead = None
+                    if lookahead is None:
+                        lookahead = Token("$end", "$end")
+                    tid = TERMINAL_IDS.get(lookahead.gettokentype(), -1)
+                i = ACTION_BASE[current_state] + tid
+                if tid < 0 or ACTION_CHECK[i] != tid:
+                    lookahead = self._recover(
+                        lookahead, state, errors, symstack, statestack,
+                        recovery
+                    )
+                    current_state = statestack[-1]
+                    if lookahead is not None:
+                        tid = TERMINAL_IDS.get(lookahead.gettokentype(), -1)
+                    continue
+                t = ACTION_VALUE[i]
+                if t > 0:
+                    statestack.append(t)
+                    current_state = t
+                    symstack.append(lookahead)
+                    lookahead = None
+                    if recovery[0]:
+                        recovery[0] -= 1
+                    continue
+                elif t == 0:
+                    return symstack[-1]
+
+            start = len(symstack) - PROD_LENGTHS[-t]
+            assert start >= 0
+            targ = symstack[start:]
+            del symstack[start:]
+            del statestack[start:]
+            if state is None:
+                value = funcs[-t](targ)
+            else:
+                value = funcs[-t](state, targ)
+            symstack.append(value)
+            current_state = GOTO_VALUE[
+                GOTO_BASE[statestack[-1]] + PROD_NONTERMINALS[-t]
+            ]
+            statestack.append(current_state)
+
+    def _recover(self, lookahead, state, errors, symstack, statestack,
+                 recovery):
+        # Works like ParserSession._recover in rply.parser.
+        error = ParsingError(None, lookahead.getsourcepos())
+        if recovery[0] == 3:
+            if lookahead.gettokentype() == "$end":
+                raise error
+            lookahead = None
+        elif not recovery[0]:
+            if self.error_handler is not None:
+                if state is None:
+                    self.error_handler(lookahead)
+                else:
+                    self.error_handler(state, lookahead)
+            errors.append(error)
+            recovery[1] = Token(
+                "error", lookahead.getstr(), lookahead.getsourcepos()
+            )
+
+        error_id = TERMINAL_IDS["error"]
+        while True:
+            i = ACTION_BASE[statestack[-1]] + error_id
+            if ACTION_CHECK[i] == error_id and ACTION_VALUE[i] > 0:
+                break
+            if len(statestack) == 1:
+                raise error
+            statestack.pop()
+            symstack.pop()
+        statestack.append(ACTION_VALUE[i])
+        symstack.append(recovery[1])
+        recovery[0] = 3
+        return lookahead
+'''
+
+
+LEXER_TEMPLATE = '''\
+# This module was generated by rply from a LexerGenerator, don't edit it.
+import re
+
+from rply.errors import LexingError
+from rply.token import SourcePosition, Token
+
+
+%(constants)s
+
+
+def lex(s):
+    \"""
+    Returns an iterator yielding the tokens in `s`, like the `lex` method of
+    the lexer this module was generated from.
+    \"""
+    return LexerStream(s)
+
+
+_compiled = []
+
+
+def _match(s, idx):
+    # The patterns are only compiled when they're first needed.
+    if not _compiled:
+        for pattern, flags, rules in PATTERNS:
+            _compiled.append((re.compile(pattern, flags), rules))
+    for regex, rules in _compiled:
+        m = regex.match(s, idx)
+        if m is not None:
+            if isinstance(rules, dict):
+                return rules[m.lastgroup], m.end()
+            return rules, m.end()
+    return -1, idx
+
+
+class LexerStream(object):
+    def __init__(self, s):
+        self.s = s
+        self.idx = 0
+        self._lineno = 1
+        self._colno = 1
+        self._line_start = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        s = self.s
+        idx = self.idx
+        while True:
+            if idx >= len(s):
+                self.idx = idx
+                raise StopIteration
+%(scan)s
+            if rule < 0:
+                self.idx = idx
+                raise LexingError(
+                    None, SourcePosition(idx, self._lineno, self._colno)
+                )
+            name = NAMES[rule]
+            if name is not None:
+                self._colno = idx - self._line_start + 1
+                token = Token(
+                    name, s[idx:end],
+                    SourcePosition(idx, self._lineno, self._colno)
+                )
+            newlines = s.count(NEWLINE, idx, end)
+            if newlines:
+                self._lineno += newlines
+                self._line_start = s.rfind(NEWLINE, idx, end) + 1
+            idx = end
+            if name is not None:
+                self.idx = idx
+                return token
+
+    def __next__(self):
+        return self.next()
+'''
+
+LEXER_DFA_SCAN = '''\
+            state = 0
+            rule = ACCEPTS[0]
+            end = pos = idx
+            while pos < len(s):
+                c = s[pos]
+                if not isinstance(c, int):
+                    c = ord(c)
+                if c >= 256:
+                    rule, end = _match(s, idx)
+                    break
+                state = TRANSITIONS[state * NCLASSES + CLASSMAP[c]]
+                if state < 0:
+                    break
+                pos += 1
+                if ACCEPTS[state] >= 0:
+                    rule = ACCEPTS[state]
+                    end = pos\
+'''
+
+LEXER_REGEX_SCAN = '''\
+            rule, end = _match(s, idx)\
+'''
+
+
+def format_constant(name, value):
+    """
+    Returns an assignment of `value` to `name` as Python source, with lists
+    and dicts split over multiple lines, so that they stay readable.
+    """
+    if isinstance(value, dict):
+        items = [
+            "%r: %r," % (k, v) for k, v in sorted(value.items())
+        ]
+        start, end = "{", "}"
+    elif isinstance(value, list):
+        items = ["%r," % (v,) for v in value]
+        start, end = "[", "]"
+    else:
+        return "%s = %r" % (name, value)
+    lines = []
+    line = "   "
+    for item in items:
+        if len(line) + len(item) + 1 > 79:
+            lines.append(line)
+            line = "   "
+        line += " " + item
+    if line.strip():
+        lines.append(line)
+    return "%s = %s\n%s\n%s" % (name, start, "\n".join(lines), end)
+
+
+def generate_parser_module(pg, table):
+    """
+    Returns the source of a module with a parser for the grammar of the
+    ParserGenerator `pg`, using the LRTable `table`.
+
+    The module reduces productions with the same loop over the tables as
+    :class:`~rply.parser.LRParser`, instead of code generated for every
+    production. Dispatching to such code costs a call per reduction, which
+    takes longer than the slicing it would save.
+    """
+    tokens, precedence, productions = grammar_signature(pg)
+    constants = [
+        ("TOKENS", tokens),
+        ("PRECEDENCE", precedence),
+        ("PRODUCTIONS", productions),
+        ("TERMINAL_IDS", table.terminal_ids),
+        ("DEFAULT_REDUCTIONS", list(table.default_reduction_table)),
+        ("ACTION_BASE", list(table.action_base)),
+        ("ACTION_CHECK", list(table.action_check)),
+        ("ACTION_VALUE", list(table.action_value)),
+        ("GOTO_BASE", list(table.goto_base)),
+        ("GOTO_VALUE", list(table.goto_value)),
+        ("PROD_LENGTHS", list(table.prod_lengths)),
+        ("PROD_NONTERMINALS", list(table.prod_nonterminals)),
+    ]
+    return PARSER_TEMPLATE % {
+        "constants": "\n".join(
+            format_constant(name, value) for name, value in constants
+        ),
+    }
+
+
+def generate_lexer_module(rules, ignore_rules):
+    """
+    Returns the source of a module with a lexer for the given rules.
+
+    If the rules can be turned into a DFA, its tables are used to lex,
+    otherwise the rules are combined into as few regular expressions as
+    possible. Either way no pattern is compiled until the module is used.
+    """
+    names = [None] * len(ignore_rules)
+    names.extend([rule.name for rule in rules])
+    patterns = []
+    for regex, groups, name in CombinedLexer(rules, ignore_rules).patterns:
+        if groups is None:
+            index = names.index(name)
+        else:
+            # The groups are named after the index of their rule.
+            index = dict([(group, int(group[1:])) for group in groups])
+        patterns.append((regex.pattern, regex.flags, index))
+    all_rules = ignore_rules + rules
+    if all_rules and not isinstance(all_rules[0].re.pattern, text_type):
+        newline = b"\n"
+    else:
+        newline = "\n"
+    constants = [
+        ("NAMES", names),
+        ("NEWLINE", newline),
+        ("PATTERNS", patterns),
+    ]
+    try:
+        dfa = DFA.from_rules(all_rules)
+    except LexerGeneratorError:
+        scan = LEXER_REGEX_SCAN
+    else:
+        scan = LEXER_DFA_SCAN
+        constants.extend([
+            ("CLASSMAP", list(dfa.classmap)),
+            ("NCLASSES", dfa.nclasses),
+            ("TRANSITIONS", list(dfa.transitions)),
+            ("ACCEPTS", list(dfa.accepts)),
+        ])
+    return LEXER_TEMPLATE % {
+        "constants": "\n".join(
+            format_constant(name, value) for name, value in constants
+        ),
+        "scan": scan,
+    }
+
+
+def grammar_signature(pg):
+    """
+    Returns the parts of the grammar of the ParserGenerator `pg` a generated
+    parser depends on. The module compares them with the ones it was
+    generated from, when its `build` function is called.
+    """
+    return (
+        sorted(pg.tokens),
+        [(assoc, list(terms)) for assoc, terms in pg.precedence],
+        [
+            (name, list(syms), precedence)
+            for name, syms, _, precedence in pg.productions
+        ],
+    )
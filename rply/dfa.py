@@ -0,0 +1,296 @@
+import re
+
+from rply.errors import LexerGeneratorError
+from rply.utils import sre_constants, sre_parse, text_type
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+
+# Instructions of the NFA programs rules are compiled to.
+CHAR, SPLIT, JMP, MATCH = range(4)
+
+MAX_PROGRAM_SIZE = 20000
+MAX_STATES = 10000
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: r"\d",
+    sre_constants.CATEGORY_NOT_DIGIT: r"\D",
+    sre_constants.CATEGORY_SPACE: r"\s",
+    sre_constants.CATEGORY_NOT_SPACE: r"\S",
+    sre_constants.CATEGORY_WORD: r"\w",
+    sre_constants.CATEGORY_NOT_WORD: r"\W",
+}
+
+REPEATS = (
+    sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT,
+    getattr(sre_constants, "POSSESSIVE_REPEAT", None),
+)
+
+_UNSUPPORTED = {
+    sre_constants.AT: "anchors",
+    sre_constants.ASSERT: "lookaround assertions",
+    sre_constants.ASSERT_NOT: "lookaround assertions",
+    sre_constants.GROUPREF: "backreferences",
+    sre_constants.GROUPREF_EXISTS: "backreferences",
+    getattr(sre_constants, "ATOMIC_GROUP", None): "atomic groups",
+    getattr(sre_constants, "POSSESSIVE_REPEAT", None): "possessive repeats",
+}
+
+
+def charset_pattern(items):
+    """
+    Turns the items of a parsed character class back into a pattern matching
+    a single character, or returns `None` if that isn't possible.
+    """
+    parts = []
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            parts.append("^")
+        elif op is sre_constants.LITERAL:
+            parts.append(re.escape(unichr(av)))
+        elif op is sre_constants.RANGE:
+            parts.append("%s-%s" % (
+                re.escape(unichr(av[0])), re.escape(unichr(av[1]))
+            ))
+        elif op is sre_constants.CATEGORY and av in _CATEGORIES:
+            parts.append(_CATEGORIES[av])
+        else:
+            return None
+    return "[%s]" % "".join(parts)
+
+
+class DFA(object):
+    """
+    A deterministic finite automaton matching a list of rules the way trying
+    them one after another with :mod:`re` does: The first rule that matches
+    wins and matches the same text it would on its own.
+
+    Characters below 256 are mapped to equivalence classes by `classmap`, the
+    state reached from `state` with the class `cls` is
+    ``transitions[state * nclasses + cls]``, or -1 if no rule can match any
+    longer. `accepts` contains the index of the rule matched when a state is
+    reached or -1. State 0 is the start state.
+    """
+    _attrs_ = ["classmap", "nclasses", "transitions", "accepts"]
+
+    def __init__(self, classmap, nclasses, transitions, accepts):
+        self.classmap = classmap
+        self.nclasses = nclasses
+        self.transitions = transitions
+        self.accepts = accepts
+
+    @classmethod
+    def from_rules(cls, rules):
+        """
+        Builds a DFA from a list of :class:`~rply.lexergenerator.Rule`
+        instances. Raises :exc:`~rply.errors.LexerGeneratorError`, if a rule
+        uses anything but the regular subset of :mod:`re` syntax: anchors,
+        lookaround assertions, backreferences, atomic groups, possessive
+        repeats and repeats of patterns that can match the empty string are
+        not supported.
+        """
+        compiler = _Compiler()
+        compiler.compile_rules(rules)
+        program = compiler.program
+
+        # Partition the characters below 256 by the character classes they
+        # belong to, so that transitions don't have to be computed for every
+        # single character.
+        signatures = {}
+        classmap = []
+        representatives = []
+        for i in range(256):
+            char = unichr(i)
+            byte = bytes(bytearray([i]))
+            signature = tuple([
+                p.match(char if isinstance(p.pattern, text_type) else byte)
+                is not None
+                for p in compiler.predicates
+            ])
+            if signature not in signatures:
+                signatures[signature] = len(representatives)
+                representatives.append(signature)
+            classmap.append(signatures[signature])
+        nclasses = len(representatives)
+
+        start_pcs, start_accept = _closure(program, [0])
+        state_ids = {(start_pcs, start_accept): 0}
+        states = [start_pcs]
+        transitions = []
+        accepts = [start_accept]
+        i = 0
+        while i < len(states):
+            pcs = states[i]
+            i += 1
+            for signature in representatives:
+                targets = []
+                for pc in pcs:
+                    if signature[program[pc][1]]:
+                        targets.append(program[pc][2])
+                key = _closure(program, targets)
+                if not key[0] and key[1] < 0:
+                    transitions.append(-1)
+                    continue
+                if key not in state_ids:
+                    if len(states) >= MAX_STATES:
+                        raise LexerGeneratorError(
+                            "Rules need more than %d DFA states" % MAX_STATES
+                        )
+                    state_ids[key] = len(states)
+                    states.append(key[0])
+                    accepts.append(key[1])
+                transitions.append(state_ids[key])
+        return cls(classmap, nclasses, transitions, accepts)
+
+
+def _closure(program, pcs):
+    """
+    Follows the epsilon transitions from `pcs`, which are ordered by priority,
+    and returns the reachable CHAR instructions in priority order together
+    with the rule matched, if any. Once a rule matches, all instructions with
+    a lower priority are dropped, as they could only lead to matches the
+    backtracking engine would never report.
+    """
+    result = []
+    seen = set()
+    stack = list(reversed(pcs))
+    while stack:
+        pc = stack.pop()
+        if pc in seen:
+            continue
+        seen.add(pc)
+        op, arg1, arg2 = program[pc]
+        if op == CHAR:
+            result.append(pc)
+        elif op == SPLIT:
+            stack.append(arg2)
+            stack.append(arg1)
+        elif op == JMP:
+            stack.append(arg1)
+        else:
+            return tuple(result), arg1
+    return tuple(result), -1
+
+
+class _Compiler(object):
+    def __init__(self):
+        # Instructions are (CHAR, predicate, next), (SPLIT, preferred, other),
+        # (JMP, target, None) and (MATCH, rule index, None).
+        self.program = []
+        self.predicates = []
+        self._predicate_ids = {}
+        # Whether the rule being compiled matches bytes.
+        self._binary = False
+
+    def emit(self, op, arg1=None, arg2=None):
+        if len(self.program) >= MAX_PROGRAM_SIZE:
+            raise LexerGeneratorError(
+                "Rules need more than %d NFA instructions" % MAX_PROGRAM_SIZE
+            )
+        self.program.append([op, arg1, arg2])
+        return len(self.program) - 1
+
+    def predicate(self, pattern, flags):
+        if self._binary:
+            pattern = pattern.encode("latin-1")
+        key = (pattern, flags)
+        if key not in self._predicate_ids:
+            self._predicate_ids[key] = len(self.predicates)
+            self.predicates.append(re.compile(pattern, flags))
+        return self._predicate_ids[key]
+
+    def compile_rules(self, rules):
+        for i, rule in enumerate(rules):
+            last = i == len(rules) - 1
+            if not last:
+                split = self.emit(SPLIT, len(self.program) + 1)
+            self._binary = not isinstance(rule.re.pattern, text_type)
+            try:
+                subpattern = sre_parse.parse(rule.re.pattern, rule.re.flags)
+                self.compile(subpattern, rule.re.flags)
+            except LexerGeneratorError as e:
+                raise LexerGeneratorError(
+                    "Rule %r can't be turned into a DFA: %s" % (
+                        rule.re.pattern, e.args[0]
+                    )
+                )
+            self.emit(MATCH, i)
+            if not last:
+                self.program[split][2] = len(self.program)
+
+    def compile(self, subpattern, flags):
+        for op, av in subpattern:
+            if op is sre_constants.LITERAL:
+                self.emit_char("[%s]" % re.escape(unichr(av)), flags)
+            elif op is sre_constants.NOT_LITERAL:
+                self.emit_char("[^%s]" % re.escape(unichr(av)), flags)
+            elif op is sre_constants.IN:
+                pattern = charset_pattern(av)
+                if pattern is None:
+                    raise LexerGeneratorError("unsupported character class")
+                self.emit_char(pattern, flags)
+            elif op is sre_constants.ANY:
+                self.emit_char(".", flags)
+            elif op is sre_constants.BRANCH:
+                self.compile_branch(av[1], flags)
+            elif op is sre_constants.SUBPATTERN:
+                sub_flags = flags
+                if len(av) == 4:
+                    sub_flags = (flags | av[1]) & ~av[2]
+                self.compile(av[-1], sub_flags)
+            elif op is sre_constants.MAX_REPEAT:
+                self.compile_repeat(av, flags, greedy=True)
+            elif op is sre_constants.MIN_REPEAT:
+                self.compile_repeat(av, flags, greedy=False)
+            else:
+                raise LexerGeneratorError("%s are not supported" % (
+                    _UNSUPPORTED.get(op, str(op).lower()),
+                ))
+
+    def emit_char(self, pattern, flags):
+        self.emit(CHAR, self.predicate(pattern, flags), len(self.program) + 1)
+
+    def compile_branch(self, branches, flags):
+        jumps = []
+        for i, branch in enumerate(branches):
+            if i < len(branches) - 1:
+                split = self.emit(SPLIT, len(self.program) + 1)
+            self.compile(branch, flags)
+            if i < len(branches) - 1:
+                jumps.append(self.emit(JMP))
+                self.program[split][2] = len(self.program)
+        for jump in jumps:
+            self.program[jump][1] = len(self.program)
+
+    def compile_repeat(self, av, flags, greedy):
+        min_count, max_count, body = av
+        if body.getwidth()[0] == 0:
+            raise LexerGeneratorError(
+                "repeating a pattern that can match the empty string is not "
+                "supported"
+            )
+        for _ in range(min_count):
+            self.compile(body, flags)
+        if max_count == sre_constants.MAXREPEAT:
+            split = self.emit(SPLIT)
+            self.compile(body, flags)
+            self.emit(JMP, split)
+            self._patch_split(split, len(self.program), greedy)
+        else:
+            splits = []
+            for _ in range(max_count - min_count):
+                splits.append(self.emit(SPLIT))
+                self.compile(body, flags)
+            for split in splits:
+                self._patch_split(split, len(self.program), greedy)
+
+    def _patch_split(self, split, exit, greedy):
+        if greedy:
+            self.program[split][1] = split + 1
+            self.program[split][2] = exit
+        else:
+            self.program[split][1] = exit
+            self.program[split][2] = split + 1
@@ -91,6 +91,7 @@ class Grammar(object):
         Walks the list of productions and builds a complete set of the LR
         items.
         """
+        item_id = 0
         for p in self.productions:
             lastlri = p
             i = 0
@@ -107,7 +108,8 @@ class Grammar(object):
                         after = self.prod_names[p.prod[i]]
                     except (IndexError, KeyError):
                         after = []
-                    lri = LRItem(p, i, before, after)
+                    lri = LRItem(p, i, before, after, item_id)
+                    item_id += 1
                 lastlri.lr_next = lri
                 if lri is None:
                     break
@@ -118,14 +120,15 @@ class Grammar(object):
 
     def _first(self, beta):
         result = []
+        seen = set()
         for x in beta:
             x_produces_empty = False
             for f in self.first[x]:
                 if f == "<empty>":
                     x_produces_empty = True
-                else:
-                    if f not in result:
-                        result.append(f)
+                elif f not in seen:
+                    seen.add(f)
+                    result.append(f)
             if not x_produces_empty:
                 break
         else:
@@ -138,8 +141,12 @@ class Grammar(object):
 
         self.first["$end"] = ["$end"]
 
+        # Sets with the same contents as the lists in self.first, for fast
+        # membership tests.
+        first_sets = {}
         for n in self.nonterminals:
             self.first[n] = []
+            first_sets[n] = set()
 
         changed = True
         while changed:
@@ -147,16 +154,20 @@ class Grammar(object):
             for n in self.nonterminals:
                 for p in self.prod_names[n]:
                     for f in self._first(p.prod):
-                        if f not in self.first[n]:
+                        if f not in first_sets[n]:
+                            first_sets[n].add(f)
                             self.first[n].append(f)
                             changed = True
 
     def compute_follow(self):
+        follow_sets = {}
         for k in self.nonterminals:
             self.follow[k] = []
+            follow_sets[k] = set()
 
         start = self.start
         self.follow[start] = ["$end"]
+        follow_sets[start] = set(["$end"])
 
         added = True
         while added:
@@ -167,14 +178,16 @@ class Grammar(object):
                         fst = self._first(p.prod[i + 1:])
                         has_empty = False
                         for f in fst:
-                            if f != "<empty>" and f not in self.follow[B]:
+                            if f != "<empty>" and f not in follow_sets[B]:
+                                follow_sets[B].add(f)
                                 self.follow[B].append(f)
                                 added = True
                             if f == "<empty>":
                                 has_empty = True
                         if has_empty or i == (len(p.prod) - 1):
                             for f in self.follow[p.name]:
-                                if f not in self.follow[B]:
+                                if f not in follow_sets[B]:
+                                    follow_sets[B].add(f)
                                     self.follow[B].append(f)
                                     added = True
 
@@ -194,7 +207,6 @@ class Production(object):
 
         self.lr_items = []
         self.lr_next = None
-        self.lr0_added = 0
         self.reduced = 0
 
     def __repr__(self):
@@ -205,7 +217,9 @@ class Production(object):
 
 
 class LRItem(object):
-    def __init__(self, p, n, before, after):
+    def __init__(self, p, n, before, after, item_id):
+        # Unique among the items of a grammar.
+        self.item_id = item_id
         self.name = p.name
         self.prod = p.prod[:]
         self.prod.insert(n, ".")
@@ -0,0 +1,223 @@
+"""
+Incremental parsing, which updates the tokens and the result of a parse after
+an edit to the source, instead of lexing and parsing all of it again.
+"""
+from rply.lexer import _relex
+from rply.parser import ParserSession
+from rply.token import Token
+from rply.utils import iteritems
+
+
+class IncrementalParse(object):
+    """
+    The tokens and result of parsing `source`, as returned by
+    :meth:`~rply.parser.LRParser.parse_incremental`. Call :meth:`edit` to get
+    the parse of the source after an edit.
+
+    Besides the result, the value of every production reduced is kept, along
+    with the state the parser was in before its first token and the tokens it
+    covers. After an edit the parser pushes the value of a production again
+    without parsing its tokens, when it gets to the same state at the start
+    of the same tokens, as long as those and the token following them are
+    unchanged.
+    """
+    def __init__(self, parser, lexer, source, state, reuse_moved):
+        self.parser = parser
+        self.lexer = lexer
+        self.source = source
+        self.state = state
+        self.reuse_moved = reuse_moved
+        self.tokens = []
+        self.result = None
+        self.errors = []
+        # Maps the index of the first token and the state before it to a
+        # list of `(number of tokens, state after, value)` tuples, in the
+        # order the productions were reduced, which is the order of
+        # increasing length. The lists are shared between parses, so they
+        # must be copied before they're changed.
+        self.nodes = {}
+        # The number of productions, whose values were reused.
+        self.reused = 0
+
+    def edit(self, start, end, new_text):
+        """
+        Returns a new :class:`IncrementalParse` for the source, in which the
+        text between the indices `start` and `end` is replaced by `new_text`.
+        This one stays unchanged.
+
+        Besides lexing and parsing what the edit changed, this takes time
+        linear in the number of tokens and productions after it, which are
+        moved to their new positions.
+
+        Raises :exc:`~rply.LexingError` and :exc:`~rply.ParsingError` like
+        parsing the new source from scratch would.
+        """
+        if not 0 <= start <= end <= len(self.source):
+            raise ValueError("Edit out of range: %d to %d" % (start, end))
+        source = self.source[:start] + new_text + self.source[end:]
+        tokens, first, old_end, new_end, moved = _relex(
+            self.lexer, self.tokens, source, start, end, new_text
+        )
+
+        # Only productions before the replaced tokens, including the token
+        # that followed them, and after the replaced tokens are still valid.
+        shift = new_end - old_end
+        reuse_after = not moved or self.reuse_moved
+        nodes = {}
+        for key, entries in iteritems(self.nodes):
+            i = key[0]
+            if i < first:
+                if i + entries[-1][0] < first:
+                    nodes[key] = entries
+                else:
+                    kept = [node for node in entries if i + node[0] < first]
+                    if kept:
+                        nodes[key] = kept
+            elif i >= old_end and reuse_after:
+                nodes[i + shift, key[1]] = entries
+
+        parse = IncrementalParse(
+            self.parser, self.lexer, source, self.state, self.reuse_moved
+        )
+        parse._parse(tokens, nodes)
+        return parse
+
+    def _parse(self, tokens, nodes):
+        session = IncrementalSession(self.parser, self.state)
+        session.parse(tokens, nodes)
+        self.tokens = tokens
+        self.nodes = nodes
+        self.result = session.result
+        self.errors = session.errors
+        self.reused = session.reused
+
+
+class IncrementalSession(ParserSession):
+    """
+    A session, which parses a list of tokens and records the value of every
+    production it reduces, reusing the recorded values where it can.
+    """
+    def __init__(self, parser, state):
+        # Unlike the base class, this doesn't start parsing right away, the
+        # tokens are all passed to parse() instead.
+        self.parser = parser
+        self.state = state
+        self.errors = []
+        self.statestack = [0]
+        self.symstack = [Token("$end", "$end")]
+        # The index of the first token of every symbol on the stack.
+        self.startstack = [0]
+        self.current_state = 0
+        self.finished = False
+        self.result = None
+        self.recovering = 0
+        self.error_token = None
+        self.reused = 0
+
+    def parse(self, tokens, nodes):
+        lr_table = self.parser.lr_table
+        productions = lr_table.grammar.productions
+        terminal_ids = lr_table.terminal_ids
+        default_reductions = lr_table.default_reduction_table
+        action_base = lr_table.action_base
+        action_check = lr_table.action_check
+        action_value = lr_table.action_value
+        goto_base = lr_table.goto_base
+        goto_value = lr_table.goto_value
+        prod_lengths = lr_table.prod_lengths
+        prod_nonterminals = lr_table.prod_nonterminals
+        symstack = self.symstack
+        statestack = self.statestack
+        startstack = self.startstack
+        state = self.state
+
+        end_token = Token("$end", "$end")
+        current_state = 0
+        # The index of the next token to shift.
+        position = 0
+        lookahead = None
+        tid = -1
+        # Productions containing the last error aren't recorded, because
+        # recovering from it may have discarded states before them.
+        last_error = -1
+        # The keys of the lists in nodes this parse made its own copy of.
+        copied = set()
+        while True:
+            entries = nodes.get((position, current_state))
+            if entries is not None and not self.recovering:
+                length, current_state, value = entries[-1]
+                statestack.append(current_state)
+                symstack.append(value)
+                startstack.append(position)
+                position += length
+                lookahead = None
+                tid = -1
+                self.reused += 1
+                continue
+
+            t = default_reductions[current_state]
+            if not t:
+                if lookahead is None:
+                    if position < len(tokens):
+                        lookahead = tokens[position]
+                    else:
+                        lookahead = end_token
+                    tid = terminal_ids.get(lookahead.gettokentype(), -1)
+                i = action_base[current_state] + tid
+                if tid < 0 or action_check[i] != tid:
+                    self.current_state = current_state
+                    last_error = position
+                    lookahead = self._recover(lookahead)
+                    current_state = self.current_state
+                    # The stack was cut back and error shifted.
+                    del startstack[len(symstack) - 1:]
+                    startstack.append(position)
+                    if lookahead is None:
+                        position += 1
+                    else:
+                        tid = terminal_ids.get(lookahead.gettokentype(), -1)
+                    continue
+                t = action_value[i]
+                if t > 0:
+                    statestack.append(t)
+                    current_state = t
+                    symstack.append(lookahead)
+                    startstack.append(position)
+                    position += 1
+                    lookahead = None
+                    tid = -1
+                    if self.recovering:
+                        self.recovering -= 1
+                    continue
+                elif t == 0:
+                    self.current_state = current_state
+                    self.finished = True
+                    self.result = symstack[-1]
+                    return
+
+            n = prod_lengths[-t]
+            start = len(symstack) - n
+            assert start >= 0
+            first = startstack[start] if n else position
+            targ = symstack[start:]
+            del symstack[start:]
+            del statestack[start:]
+            del startstack[start:]
+            p = productions[-t]
+            if state is None:
+                value = p.func(targ)
+            else:
+                value = p.func(state, targ)
+            symstack.append(value)
+            entry = statestack[-1]
+            current_state = goto_value[goto_base[entry] + prod_nonterminals[-t]]
+            statestack.append(current_state)
+            startstack.append(first)
+            if n and first > last_error:
+                key = (first, entry)
+                node = (position - first, current_state, value)
+                if key in copied:
+                    nodes[key].append(node)
+                else:
+                    nodes[key] = nodes.get(key, []) + [node]
+                    copied.add(key)
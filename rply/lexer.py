@@ -1,14 +1,553 @@
+import multiprocessing
+import re
+from array import array
+
+from rply.dfa import DFA
 from rply.errors import LexingError
-from rply.token import SourcePosition, Token
+from rply.token import (
+    IndexedToken, LineIndex, SourcePosition, Token, TokenBatch
+)
+from rply.utils import sre_constants, sre_parse, text_type, we_are_translated
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_PARALLEL_CHUNK_SIZE = 1024 * 1024
 
 
 class Lexer(object):
-    def __init__(self, rules, ignore_rules):
+    def __init__(self, rules, ignore_rules, lazy_positions=False):
         self.rules = rules
         self.ignore_rules = ignore_rules
+        self.lazy_positions = lazy_positions
+        # For every character below 256 the rules, that can match starting
+        # with that character. Other characters have to try all of them.
+        self.rule_table = _dispatch_table(rules)
+        self.ignore_table = _dispatch_table(ignore_rules)
+
+        self.token_names = []
+        self.token_ids = {}
+        for rule in rules:
+            if rule.name not in self.token_ids:
+                self.token_ids[rule.name] = len(self.token_names)
+                self.token_names.append(rule.name)
+
+        # Whether this lexer matches bytes-like objects, see _for_input().
+        self.binary = False
+        self._binary_lexer = None
+
+    def lex(self, s):
+        return LexerStream(self._for_input(s), s)
+
+    def _for_input(self, s):
+        """
+        Returns the lexer to use for `s`. That's a copy of this lexer with
+        rules compiled as bytes patterns, if `s` is a bytes-like object such
+        as :class:`bytes`, :class:`bytearray`, :class:`memoryview` or
+        :class:`mmap.mmap`.
+        """
+        if we_are_translated() or self.binary or isinstance(s, text_type):
+            return self
+        if self._binary_lexer is None:
+            lexer = self.__class__(
+                [rule.to_bytes() for rule in self.rules],
+                [rule.to_bytes() for rule in self.ignore_rules],
+                self.lazy_positions,
+            )
+            lexer.binary = True
+            self._binary_lexer = lexer
+        return self._binary_lexer
+
+    def lex_stream(self, fileobj, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Returns an iterator yielding the tokens lexed from a file-like object,
+        which is read in chunks of `chunk_size` as tokens are needed, instead
+        of all at once. The tokens, including their positions, are the same
+        :meth:`lex` produces for the whole content.
+
+        Tokens are re-matched when a match runs into the end of the data read
+        so far, however a match that depends on more than `chunk_size`
+        characters of lookahead past its end may differ.
+        """
+        return ChunkedLexerStream(self, fileobj, chunk_size)
+
+    def lex_async(self, reader, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Like :meth:`lex_stream`, but reads from an :class:`asyncio.StreamReader`
+        or any other object with a `read(n)` coroutine, returning an
+        asynchronous iterator over the tokens. Requires Python 3.5 or later.
+
+        Unlike :meth:`lex_stream`, a token is returned as soon as the data
+        read so far contains all of it, so that input arriving over a
+        connection that stays open is lexed without waiting for more. So a
+        match that depends on lookahead past the end of the data read so far
+        may differ, if it doesn't run into the end.
+        """
+        from rply.aio import AsyncLexerStream
+
+        return AsyncLexerStream(self, reader, chunk_size)
+
+    def lex_batch(self, s):
+        """
+        Lexes all of `s` at once and returns a
+        :class:`~rply.token.TokenBatch`, which stores the type, start and end
+        of every token in arrays instead of creating :class:`~rply.Token`
+        instances. Type ids index into :attr:`token_names`.
+
+        The batch can be passed to :meth:`~rply.parser.LRParser.parse`
+        directly.
+        """
+        stream = self.lex(s)
+        # Positions are only needed for errors.
+        stream.line_index = LineIndex(s)
+        types = array("i")
+        starts = array("l")
+        ends = array("l")
+        _scan_arrays(stream, self.token_ids, types, starts, ends)
+        return TokenBatch(
+            self.token_names, types, starts, ends, s, stream.line_index
+        )
+
+    def lex_parallel(self, s, workers=None,
+                     chunk_size=DEFAULT_PARALLEL_CHUNK_SIZE, no_split=None):
+        """
+        Lexes `s` in a pool of `workers` processes, by default one per CPU,
+        and returns a :class:`~rply.token.TokenBatch` like :meth:`lex_batch`.
+
+        `s` is split after newlines into chunks of about `chunk_size`
+        characters, which are lexed independently. Where a chunk was split
+        in the middle of a token, for example a string spanning lines, this
+        process lexes from the token before the split, until its tokens line
+        up with those of the next chunk again. To keep that from happening,
+        pass a regular expression matching the text that mustn't be split,
+        as `no_split`. Chunks only end outside of its matches then.
+
+        The tokens are the same :meth:`lex_batch` returns, as long as no rule
+        uses anchors or lookbehind. Like with :meth:`lex_stream`, a match
+        that depends on more than `DEFAULT_CHUNK_SIZE` characters of
+        lookahead past its start may differ.
+        """
+        lexer = self._for_input(s)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1 or len(s) <= chunk_size:
+            return lexer.lex_batch(s)
+        if isinstance(no_split, (text_type, bytes)):
+            no_split = re.compile(no_split)
+
+        pool = multiprocessing.Pool(workers, _init_worker, (lexer,))
+        try:
+            results = pool.imap(
+                _lex_chunk, _split_chunks(s, chunk_size, no_split)
+            )
+            return _merge_chunks(lexer, s, results)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def relex(self, old_tokens, source, edit_start, edit_end, new_text):
+        """
+        Returns the tokens of `source`, after the text between the indices
+        `edit_start` and `edit_end` of the source `old_tokens` were lexed
+        from was replaced by `new_text`. `source` is the text after the edit.
+
+        Lexing starts again at the last token before the edit and stops as
+        soon as a token starts where one of the old tokens after the edit
+        does, at its position moved by the edit, and has the same type and
+        text. The old tokens from there on are reused, so the time spent
+        lexing depends on the size of the edit instead of the source.
+        `old_tokens` isn't changed.
+
+        That doesn't make relexing independent of the size of the source
+        though. The list of tokens returned is a new one and if the edit
+        changed the positions of the tokens after it, those are copied with
+        their new positions, which takes time linear in their number, if
+        less than lexing them. With `lazy_positions`, the line starts found
+        in the source before the edit are moved, instead of searching the
+        new source for them again.
+
+        The tokens are the same :meth:`lex` produces for `source`, unless a
+        rule depends on more text after a token than the token itself.
+        """
+        valid = 0 <= edit_start <= edit_end
+        if not valid or edit_start + len(new_text) > len(source):
+            raise ValueError(
+                "Edit out of range: %d to %d" % (edit_start, edit_end)
+            )
+        return _relex(
+            self, old_tokens, source, edit_start, edit_end, new_text
+        )[0]
+
+
+def _scan_arrays(stream, token_ids, types, starts, ends, offset=0):
+    # Appends the type, start and end of every remaining token of the stream
+    # to the arrays, adding offset to the indices.
+    while True:
+        try:
+            name, start, end = stream._scan()
+        except StopIteration:
+            break
+        types.append(token_ids[name])
+        starts.append(offset + start)
+        ends.append(offset + end)
+        stream.idx = end
+
+
+def _split_chunks(s, chunk_size, no_split):
+    """
+    Yields the chunks :meth:`Lexer.lex_parallel` lexes in the workers, each
+    with the index it starts at in `s`, the length of the part of it in which
+    tokens start and whether it reaches the end of `s`. Chunks end after a
+    newline that isn't within a match of `no_split`, or at the end of `s`,
+    and include `DEFAULT_CHUNK_SIZE` characters of lookahead after that.
+    """
+    newlines = LineIndex(s)
+    matches = no_split.finditer(s) if no_split is not None else iter([])
+    match = next(matches, None)
+    start = 0
+    while start < len(s):
+        target = start + chunk_size
+        while True:
+            nl = newlines._find_newline(min(target, len(s)), len(s))
+            if nl < 0:
+                end = len(s)
+                break
+            end = nl + 1
+            while match is not None and match.end() <= end:
+                match = next(matches, None)
+            if match is None or match.start() >= end:
+                break
+            target = match.end()
+        chunk = s[start:end + DEFAULT_CHUNK_SIZE]
+        if isinstance(chunk, memoryview):
+            chunk = chunk.tobytes()
+        yield chunk, start, end - start, end + DEFAULT_CHUNK_SIZE >= len(s)
+        start = end
+
+
+_worker_lexer = None
+
+
+def _init_worker(lexer):
+    global _worker_lexer
+    _worker_lexer = lexer
+
+
+def _lex_chunk(args):
+    """
+    Lexes the tokens starting within a chunk in a worker process and returns
+    their arrays, with indices in the whole input.
+
+    Tokens that run into the end of the lookahead are left out, as is
+    everything after an error, which may be caused by the split. Lexing the
+    whole input gets to those.
+    """
+    chunk, offset, stop, at_end = args
+    stream = _worker_lexer.lex(chunk)
+    stream.line_index = LineIndex(chunk)
+    token_ids = _worker_lexer.token_ids
+    types = array("i")
+    starts = array("l")
+    ends = array("l")
+    try:
+        while True:
+            name, start, end = stream._scan()
+            if start >= stop or (end == len(chunk) and not at_end):
+                break
+            types.append(token_ids[name])
+            starts.append(offset + start)
+            ends.append(offset + end)
+            stream.idx = end
+    except (StopIteration, LexingError):
+        pass
+    return types, starts, ends
+
+
+def _merge_chunks(lexer, s, results):
+    """
+    Joins the tokens of the chunks lexed by :func:`_lex_chunk` into a
+    :class:`~rply.token.TokenBatch`.
+
+    Lexing continues the same way from any index a token starts at, so a
+    chunk's tokens are used from the first one, that starts where lexing
+    from the end of the tokens used so far gets to a token as well. Tokens
+    before that are lexed here, which usually only takes one token, unless
+    the chunk starts in the middle of one.
+    """
+    token_ids = lexer.token_ids
+    line_index = LineIndex(s)
+    stream = lexer.lex(s)
+    stream.line_index = line_index
+    types = array("i")
+    starts = array("l")
+    ends = array("l")
+    for chunk_types, chunk_starts, chunk_ends in results:
+        n = len(chunk_types)
+        j = 0
+        while j < n:
+            try:
+                name, start, end = stream._scan()
+            except StopIteration:
+                break
+            while j < n and chunk_starts[j] < start:
+                j += 1
+            if j < n and chunk_starts[j] == start:
+                types.extend(chunk_types[j:])
+                starts.extend(chunk_starts[j:])
+                ends.extend(chunk_ends[j:])
+                stream.idx = chunk_ends[n - 1]
+                break
+            types.append(token_ids[name])
+            starts.append(start)
+            ends.append(end)
+            stream.idx = end
+    # Whatever follows the last chunk's tokens, including the error at which
+    # lexing stopped if any.
+    _scan_arrays(stream, token_ids, types, starts, ends)
+    return TokenBatch(
+        lexer.token_names, types, starts, ends, s, line_index
+    )
+
+
+def _relex(lexer, tokens, source, start, end, new_text):
+    """
+    Does the work of :meth:`Lexer.relex`. Besides the new tokens, returns the
+    index of the first token lexed again, the index of the first old token
+    reused after the edit and its new index, and whether the positions of the
+    tokens after the edit changed.
+    """
+    delta = len(new_text) - (end - start)
+    stream = lexer.lex(source)
+    old_index = None
+    if stream.line_index is not None:
+        old_index = _old_line_index(tokens, source, start, end, new_text)
+        if old_index is not None:
+            stream.line_index = old_index.edited(source, start, end, new_text)
+    first = _count_before(tokens, start)
+    if first > 0:
+        first -= 1
+        stream.idx = _token_start(tokens[first])
+        if stream.line_index is None:
+            stream._lineno = tokens[first].getsourcepos().lineno
+
+    new_end = start + len(new_text)
+    j = _count_before(tokens, end)
+    relexed = []
+    synced = None
+    for token in stream:
+        pos = stream.idx - len(token.getstr())
+        if pos >= new_end:
+            while j < len(tokens) and _token_start(tokens[j]) + delta < pos:
+                j += 1
+            if j < len(tokens) and _token_start(tokens[j]) + delta == pos:
+                if tokens[j] == token:
+                    synced = token
+                    break
+        relexed.append(token)
+
+    if synced is None:
+        new_tokens = tokens[:first] + relexed
+        return new_tokens, first, len(tokens), len(new_tokens), False
+    if old_index is not None:
+        # Comparing the lines of the replaced text with those of new_text
+        # avoids searching the source for the line numbers of the tokens.
+        old_lines = _line_starts(old_index.s[start:end])
+        moved = delta != 0 or old_lines != _line_starts(new_text)
+    else:
+        new_pos = synced.getsourcepos()
+        old_pos = tokens[j].getsourcepos()
+        line_shift = new_pos.lineno - old_pos.lineno
+        col_shift = new_pos.colno - old_pos.colno
+        moved = bool(delta or line_shift or col_shift)
+    if not moved:
+        rest = tokens[j:]
+    elif stream.line_index is not None:
+        rest = [
+            IndexedToken(
+                t.name, t.value, _token_start(t) + delta, stream.line_index
+            )
+            for t in tokens[j:]
+        ]
+    else:
+        rest = []
+        for t in tokens[j:]:
+            pos = t.getsourcepos()
+            colno = pos.colno
+            # Only tokens on the line the edit ended on change columns.
+            if pos.lineno == old_pos.lineno:
+                colno += col_shift
+            rest.append(Token(t.name, t.value, SourcePosition(
+                pos.idx + delta, pos.lineno + line_shift, colno
+            )))
+    new_tokens = tokens[:first] + relexed + rest
+    return new_tokens, first, j, first + len(relexed), moved
+
+
+def _old_line_index(tokens, source, start, end, new_text):
+    """
+    Returns the :class:`LineIndex` the last old token was lexed with, if
+    that's the index of the source before the edit, otherwise `None`. Tokens
+    reused after an edit that didn't move them keep the index of an older
+    source, which is checked for here.
+    """
+    if not tokens or not isinstance(tokens[-1], IndexedToken):
+        return None
+    old = tokens[-1].line_index
+    new_end = start + len(new_text)
+    same = len(old.s) - end == len(source) - new_end
+    same = same and old.s[:start] == source[:start]
+    if same and old.s[end:] == source[new_end:]:
+        return old
+    return None
+
+
+def _line_starts(s):
+    index = LineIndex(s)
+    index._scan_to(len(s))
+    return index.line_starts
+
+
+def _token_start(token):
+    if isinstance(token, IndexedToken):
+        return token.idx
+    return token.getsourcepos().idx
+
+
+def _count_before(tokens, idx):
+    # Binary search for the number of tokens starting before idx.
+    lo = 0
+    hi = len(tokens)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _token_start(tokens[mid]) < idx:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _dispatch_table(rules):
+    table = []
+    candidate_lists = {}
+    for i in range(256):
+        candidates = [
+            rule for rule in rules if rule.may_start_with(_char(rule.re, i))
+        ]
+        table.append(candidate_lists.setdefault(tuple(candidates), candidates))
+    return table
+
+
+def _char(regex, i):
+    if isinstance(regex.pattern, text_type):
+        return chr(i)
+    return bytes(bytearray([i]))
+
+
+def _pattern_text(regex):
+    if isinstance(regex.pattern, text_type):
+        return regex.pattern
+    return regex.pattern.decode("latin-1")
+
+
+class CombinedLexer(Lexer):
+    """
+    A lexer that compiles its rules into a single alternation of named groups,
+    so that every token costs one regular expression match instead of one per
+    rule.
+
+    Rules are only combined when they share the same flags and don't use
+    named groups or backreferences, any other rule gets a pattern of its own.
+    The alternatives are tried in order, ignore rules first, so the first rule
+    added still wins.
+    """
+    def __init__(self, rules, ignore_rules, lazy_positions=False):
+        Lexer.__init__(self, rules, ignore_rules, lazy_positions)
+        self.patterns = []
+
+        alternatives = []
+        names = {}
+        kind = None
+        entries = [(None, rule) for rule in ignore_rules]
+        entries.extend([(rule.name, rule) for rule in rules])
+        for i, (name, rule) in enumerate(entries):
+            combinable = _is_combinable(rule.re)
+            rule_kind = (rule.re.flags, isinstance(rule.re.pattern, text_type))
+            if alternatives and (not combinable or rule_kind != kind):
+                self._add_pattern(alternatives, names, kind)
+                alternatives = []
+                names = {}
+            if not combinable:
+                self.patterns.append((rule.re, None, name))
+                continue
+            group = "_%d" % i
+            alternatives.append("(?P<%s>%s)" % (group, _pattern_text(rule.re)))
+            names[group] = name
+            kind = rule_kind
+        if alternatives:
+            self._add_pattern(alternatives, names, kind)
+
+    def _add_pattern(self, alternatives, names, kind):
+        flags, text = kind
+        pattern = "|".join(alternatives)
+        if not text:
+            pattern = pattern.encode("latin-1")
+        self.patterns.append((re.compile(pattern, flags), names, None))
+
+    def lex(self, s):
+        return CombinedLexerStream(self._for_input(s), s)
+
+
+class DFALexer(Lexer):
+    """
+    A lexer that turns its rules into a single deterministic finite
+    automaton, which looks at every character once, no matter how many rules
+    there are.
+
+    Raises :exc:`~rply.errors.LexerGeneratorError`, if a rule uses syntax that
+    can't be expressed that way. Characters beyond the first 256 code points
+    are handed to the regular rules.
+    """
+    def __init__(self, rules, ignore_rules, lazy_positions=False):
+        Lexer.__init__(self, rules, ignore_rules, lazy_positions)
+        self.dfa = DFA.from_rules(ignore_rules + rules)
+        self.names = [None] * len(ignore_rules)
+        self.names.extend([rule.name for rule in rules])
 
     def lex(self, s):
-        return LexerStream(self, s)
+        return DFALexerStream(self._for_input(s), s)
+
+
+_global_flags_re = re.compile(r"\(\?[aiLmsux]+\)")
+
+
+def _is_combinable(regex):
+    if regex.groupindex or _global_flags_re.search(_pattern_text(regex)):
+        return False
+    return not _has_group_references(sre_parse.parse(regex.pattern, regex.flags))
+
+
+def _has_group_references(subpattern):
+    for op, av in subpattern:
+        if op is sre_constants.GROUPREF:
+            return True
+        elif op is sre_constants.GROUPREF_EXISTS:
+            return True
+        elif op is sre_constants.BRANCH:
+            children = av[1]
+        elif op is sre_constants.SUBPATTERN:
+            children = [av[-1]]
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT,
+                    getattr(sre_constants, "POSSESSIVE_REPEAT", None)):
+            children = [av[2]]
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            children = [av[1]]
+        elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+            children = [av]
+        else:
+            continue
+        for child in children:
+            if _has_group_references(child):
+                return True
+    return False
 
 
 class LexerStream(object):
@@ -20,43 +559,256 @@ class LexerStream(object):
         self._lineno = 1
         self._colno = 1
 
+        self.line_index = None
+        if lexer.lazy_positions or lexer.binary:
+            self.line_index = LineIndex(s)
+
     def __iter__(self):
         return self
 
-    def _update_pos(self, match):
-        self.idx = match.end
-        self._lineno += self.s.count("\n", match.start, match.end)
-        last_nl = self.s.rfind("\n", 0, match.start)
+    def _update_pos(self, start, end):
+        self.idx = end
+        if self.line_index is not None:
+            return 0
+        self._lineno += self.s.count("\n", start, end)
+        last_nl = self.s.rfind("\n", 0, start)
         if last_nl < 0:
-            return match.start + 1
+            return start + 1
         else:
-            return match.start - last_nl
+            return start - last_nl
 
-    def next(self):
+    def _make_token(self, name, start, end):
+        if self.line_index is not None:
+            self.idx = end
+            return IndexedToken(
+                name, self.s[start:end], start, self.line_index
+            )
+        lineno = self._lineno
+        self._colno = self._update_pos(start, end)
+        source_pos = SourcePosition(start, lineno, self._colno)
+        return Token(name, self.s[start:end], source_pos)
+
+    def _error(self):
+        if self.line_index is not None:
+            return LexingError(None, self.line_index.getsourcepos(self.idx))
+        return LexingError(None, SourcePosition(
+            self.idx, self._lineno, self._colno))
+
+    def _scan(self):
+        """
+        Skips ignored text and returns the name, start and end of the next
+        token, without advancing past it.
+        """
         while True:
             if self.idx >= len(self.s):
                 raise StopIteration
-            for rule in self.lexer.ignore_rules:
+            c = self.s[self.idx]
+            if not isinstance(c, int):
+                c = ord(c)
+            if c < 256:
+                ignore_rules = self.lexer.ignore_table[c]
+            else:
+                ignore_rules = self.lexer.ignore_rules
+            for rule in ignore_rules:
                 match = rule.matches(self.s, self.idx)
                 if match:
-                    self._update_pos(match)
+                    self._update_pos(match.start, match.end)
                     break
             else:
                 break
 
-        for rule in self.lexer.rules:
+        if c < 256:
+            rules = self.lexer.rule_table[c]
+        else:
+            rules = self.lexer.rules
+        for rule in rules:
             match = rule.matches(self.s, self.idx)
             if match:
-                lineno = self._lineno
-                self._colno = self._update_pos(match)
-                source_pos = SourcePosition(match.start, lineno, self._colno)
-                token = Token(
-                    rule.name, self.s[match.start:match.end], source_pos
-                )
-                return token
+                return rule.name, match.start, match.end
         else:
-            raise LexingError(None, SourcePosition(
-                self.idx, self._lineno, self._colno))
+            raise self._error()
+
+    def next(self):
+        name, start, end = self._scan()
+        return self._make_token(name, start, end)
+
+    def __next__(self):
+        return self.next()
+
+
+class CombinedLexerStream(LexerStream):
+    def _scan(self):
+        while True:
+            if self.idx >= len(self.s):
+                raise StopIteration
+            for pattern, names, name in self.lexer.patterns:
+                m = pattern.match(self.s, self.idx)
+                if m is not None:
+                    if names is not None:
+                        name = names[m.lastgroup]
+                    break
+            else:
+                raise self._error()
+            if name is None:
+                self._update_pos(m.start(), m.end())
+            else:
+                return name, m.start(), m.end()
+
+
+class DFALexerStream(LexerStream):
+    def _scan(self):
+        dfa = self.lexer.dfa
+        while True:
+            if self.idx >= len(self.s):
+                raise StopIteration
+            state = 0
+            accept = dfa.accepts[0]
+            end = pos = self.idx
+            while pos < len(self.s):
+                c = self.s[pos]
+                if not isinstance(c, int):
+                    c = ord(c)
+                if c >= 256:
+                    return LexerStream._scan(self)
+                state = dfa.transitions[state * dfa.nclasses + dfa.classmap[c]]
+                if state < 0:
+                    break
+                pos += 1
+                if dfa.accepts[state] >= 0:
+                    accept = dfa.accepts[state]
+                    end = pos
+            if accept < 0:
+                raise self._error()
+            name = self.lexer.names[accept]
+            if name is None:
+                self._update_pos(self.idx, end)
+            else:
+                return name, self.idx, end
+
+
+class ChunkedLexerStream(object):
+    """
+    Lexes a file-like object by keeping a buffer with the data that hasn't
+    been turned into tokens yet and at least `chunk_size` characters of
+    lookahead, which is lexed by a regular stream of the lexer.
+    """
+    def __init__(self, lexer, fileobj, chunk_size):
+        self.lexer = lexer
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.eof = False
+        # Whether to wait for `chunk_size` characters after a token, before
+        # returning it. Without that, tokens are returned as soon as they
+        # don't run into the end of the data read so far.
+        self.wait_for_lookahead = True
+        # The stream over the buffer and the index of the buffer's first
+        # character in the whole input.
+        self.stream = None
+        self.offset = 0
+        # How many characters to read, when _step() needs more input.
+        self._wanted = chunk_size
+
+        self._newline = "\n"
+        self._lineno = 1
+        self._colno = 1
+        # Newlines before this index are accounted for in _lineno.
+        self._counted = 0
+        self._line_start = 0
+
+    def __iter__(self):
+        return self
+
+    def _refill(self, chunk):
+        """
+        Drops the part of the buffer before the current index and appends
+        `chunk` to it.
+        """
+        if not chunk:
+            self.eof = True
+        if self.stream is None:
+            if not isinstance(chunk, text_type):
+                self._newline = b"\n"
+            buf = chunk
+        else:
+            idx = self.stream.idx
+            self._count_to(self.offset + idx)
+            self.offset += idx
+            buf = self.stream.s[idx:] + chunk
+        self.stream = self.lexer.lex(buf)
+        # Positions are tracked across chunks by this stream instead.
+        self.stream.line_index = LineIndex(buf)
+
+    def _count_to(self, idx):
+        start = self._counted - self.offset
+        end = idx - self.offset
+        if end > start:
+            self._lineno += self.stream.s.count(self._newline, start, end)
+            last_nl = self.stream.s.rfind(self._newline, start, end)
+            if last_nl >= 0:
+                self._line_start = self.offset + last_nl + 1
+            self._counted = idx
+
+    def _step(self):
+        """
+        Returns the next token or `None`, if `_wanted` more characters have to
+        be passed to :meth:`_refill` first.
+        """
+        if self.stream is None:
+            self._wanted = self.chunk_size
+            return None
+        buf = self.stream.s
+        waiting = self.wait_for_lookahead and not self.eof
+        if waiting and len(buf) - self.stream.idx < self.chunk_size:
+            self._wanted = self.chunk_size
+            return None
+        idx = self.stream.idx
+        try:
+            name, start, end = self.stream._scan()
+        except StopIteration:
+            if self.eof:
+                raise
+            self.stream.idx = idx
+            self._wanted = self.chunk_size
+            return None
+        except LexingError:
+            if self.eof:
+                self._count_to(self.offset + self.stream.idx)
+                raise LexingError(None, SourcePosition(
+                    self.offset + self.stream.idx, self._lineno, self._colno
+                ))
+            # The input may have been cut off in the middle of a token, keep
+            # doubling the buffer until that's no longer possible.
+            self.stream.idx = idx
+            self._wanted = max(self.chunk_size, len(buf))
+            return None
+        if not self.eof:
+            # The lookahead checked above is measured from before ignored
+            # text and the token itself, what counts is the data after it.
+            short = (
+                self.wait_for_lookahead and len(buf) - end < self.chunk_size
+            )
+            if short or end == len(buf):
+                self.stream.idx = idx
+                self._wanted = self.chunk_size
+                return None
+        return self._make_token(name, start, end)
+
+    def next(self):
+        while True:
+            token = self._step()
+            if token is not None:
+                return token
+            self._refill(self.fileobj.read(self._wanted))
+
+    def _make_token(self, name, start, end):
+        idx = self.offset + start
+        self._count_to(idx)
+        self._colno = idx - self._line_start + 1
+        self.stream.idx = end
+        return Token(
+            name, self.stream.s[start:end],
+            SourcePosition(idx, self._lineno, self._colno)
+        )
 
     def __next__(self):
         return self.next()
@@ -2,16 +2,20 @@ import re
 
 try:
     import rpython
-    from rpython.rlib.objectmodel import we_are_translated
     from rpython.rlib.rsre import rsre_core
     from rpython.rlib.rsre.rpy import get_code
 except ImportError:
     rpython = None
 
-    def we_are_translated():
-        return False
+from rply.dfa import REPEATS, charset_pattern
+from rply.errors import LexerGeneratorError
+from rply.lexer import CombinedLexer, DFALexer, Lexer
+from rply.utils import sre_constants, sre_parse, text_type, we_are_translated
 
-from rply.lexer import Lexer
+try:
+    unichr
+except NameError:
+    unichr = chr
 
 
 class Rule(object):
@@ -23,9 +27,44 @@ class Rule(object):
         if rpython:
             self._pattern = get_code(pattern, flags)
 
+        charsets, nullable = _first_charsets(sre_parse.parse(pattern, flags))
+        if charsets is None or nullable:
+            self._first_re = None
+        else:
+            first = "|".join(charsets)
+            if not isinstance(pattern, text_type):
+                first = first.encode("latin-1")
+            # Global flags like (?i) in the pattern apply to the first
+            # character as well.
+            self._first_re = re.compile(first, flags=self.re.flags)
+
     def _freeze_(self):
         return True
 
+    def may_start_with(self, char):
+        """
+        Returns whether a match of this rule can start with the given
+        character. This errs on the side of returning `True`.
+        """
+        return self._first_re is None or self._first_re.match(char) is not None
+
+    def to_bytes(self):
+        """
+        Returns a copy of this rule, that matches bytes-like objects instead
+        of strings. Only rules with ASCII patterns can be converted.
+        """
+        pattern = self.re.pattern
+        if isinstance(pattern, text_type):
+            try:
+                pattern = pattern.encode("ascii")
+            except UnicodeError:
+                raise LexerGeneratorError(
+                    "Rule %r can't match bytes, its pattern isn't ASCII" % (
+                        pattern,
+                    )
+                )
+        return Rule(self.name, pattern, self.re.flags & ~re.UNICODE)
+
     def matches(self, s, pos):
         if not we_are_translated():
             m = self.re.match(s, pos)
@@ -41,6 +80,65 @@ class Rule(object):
                 return None
 
 
+def _first_charsets(subpattern):
+    """
+    Returns a list of character classes, one of which matches the first
+    character of every non-empty match of the parsed pattern, and whether the
+    pattern can match the empty string. The list is `None` if the first
+    character can't be determined.
+    """
+    charsets = []
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL:
+            charsets.append("[%s]" % re.escape(unichr(av)))
+            return charsets, False
+        elif op is sre_constants.NOT_LITERAL:
+            charsets.append("[^%s]" % re.escape(unichr(av)))
+            return charsets, False
+        elif op is sre_constants.IN:
+            charset = charset_pattern(av)
+            if charset is None:
+                return None, False
+            charsets.append(charset)
+            return charsets, False
+        elif op is sre_constants.BRANCH:
+            nullable = False
+            for branch in av[1]:
+                branch_charsets, branch_nullable = _first_charsets(branch)
+                if branch_charsets is None:
+                    return None, False
+                charsets.extend(branch_charsets)
+                nullable = nullable or branch_nullable
+        elif op is sre_constants.SUBPATTERN:
+            # Scoped flags (?i:...) would change what the classes match.
+            if len(av) == 4 and (av[1] or av[2]):
+                return None, False
+            sub_charsets, nullable = _first_charsets(av[-1])
+            if sub_charsets is None:
+                return None, False
+            charsets.extend(sub_charsets)
+        elif op in REPEATS:
+            sub_charsets, nullable = _first_charsets(av[2])
+            if sub_charsets is None:
+                return None, False
+            charsets.extend(sub_charsets)
+            nullable = nullable or av[0] == 0
+        elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+            sub_charsets, nullable = _first_charsets(av)
+            if sub_charsets is None:
+                return None, False
+            charsets.extend(sub_charsets)
+        elif op in (sre_constants.AT, sre_constants.ASSERT,
+                    sre_constants.ASSERT_NOT):
+            # Zero-width assertions only restrict what follows them.
+            nullable = True
+        else:
+            return None, False
+        if not nullable:
+            return charsets, False
+    return charsets, True
+
+
 class Match(object):
     _attrs_ = ["start", "end"]
 
@@ -104,10 +202,53 @@ class LexerGenerator(object):
         """
         self.ignore_rules.append(Rule("", pattern, flags=flags))
 
-    def build(self):
+    def build(self, combined=False, dfa=False, lazy_positions=False):
         """
         Returns a lexer instance, which provides a `lex` method that must be
         called with a string and returns an iterator yielding
         :class:`~rply.Token` instances.
+
+        If `combined` is true, the rules are compiled into a single regular
+        expression with one named group per rule, so that every token costs
+        one match instead of one per rule. Rules that use different flags,
+        named groups or backreferences can't share that expression and are
+        matched on their own, in the order they were added. Combined lexers
+        don't work with RPython.
+
+        If `dfa` is true, the rules are turned into a single deterministic
+        finite automaton at build time, which looks at every character only
+        once, regardless of the number of rules, and can't backtrack. It
+        produces the same tokens the rules would, but only supports the
+        regular subset of the syntax. If a rule uses anchors, lookaround
+        assertions, backreferences or other unsupported constructs, the
+        lexer falls back to the `combined` or regular behaviour.
+
+        If `lazy_positions` is true, tokens only store the index of their
+        first character and compute line and column numbers when
+        :meth:`~rply.Token.getsourcepos` is called, which saves work if
+        positions are only needed to report errors.
+        """
+        if dfa:
+            try:
+                return DFALexer(self.rules, self.ignore_rules, lazy_positions)
+            except LexerGeneratorError:
+                pass
+        if combined:
+            return CombinedLexer(self.rules, self.ignore_rules, lazy_positions)
+        return Lexer(self.rules, self.ignore_rules, lazy_positions)
+
+    def generate_module(self):
         """
-        return Lexer(self.rules, self.ignore_rules)
+        Returns the source of a Python module with a lexer for the rules,
+        whose `lex` function works like the `lex` method of a built lexer.
+        Importing it is cheaper than building the lexer, because the rules
+        don't have to be analyzed and no pattern is compiled until it's used.
+
+        If all rules are supported by the `dfa` option of :meth:`build`, the
+        module lexes using the DFA's tables, otherwise it uses a combined
+        regular expression. It lexes the same kind of input, text or bytes,
+        as the patterns the rules were added with.
+        """
+        from rply.codegen import generate_lexer_module
+
+        return generate_lexer_module(self.rules, self.ignore_rules)
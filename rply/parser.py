@@ -1,4 +1,7 @@
+import multiprocessing
+
 from rply.errors import ParsingError
+from rply.token import Token, TokenBatch
 
 
 class LRParser(object):
@@ -6,81 +9,309 @@ class LRParser(object):
         self.lr_table = lr_table
         self.error_handler = error_handler
 
-    def parse(self, tokenizer, state=None):
-        from rply.token import Token
+    def start(self, state=None, errors=None):
+        """
+        Returns a :class:`ParserSession`, which parses tokens as they are
+        passed to it, instead of pulling them from an iterator like
+        :meth:`parse`.
 
-        lookahead = None
-        lookaheadstack = []
+        :param state: Passed to the productions and error handler, like with
+                      :meth:`parse`.
+        :param errors: A list to collect errors in, like with :meth:`parse`.
+        """
+        return ParserSession(self, state, errors)
 
-        statestack = [0]
-        symstack = [Token("$end", "$end")]
+    def parse(self, tokenizer, state=None, errors=None):
+        """
+        Parses the tokens produced by `tokenizer` and returns the value of the
+        start production.
 
-        current_state = 0
-        while True:
-            if self.lr_table.default_reductions[current_state]:
-                t = self.lr_table.default_reductions[current_state]
-                current_state = self._reduce_production(
-                    t, symstack, statestack, state
-                )
-                continue
+        If the grammar has productions with the `error` terminal, the parser
+        recovers from syntax errors the way yacc does: it discards states
+        until it gets to one in which `error` can be shifted, shifts it and
+        then discards tokens until one can follow it. If it can't recover,
+        a :exc:`~rply.ParsingError` is raised.
+
+        :param state: Passed to the productions and error handler as first
+                      argument, if it's not `None`.
+        :param errors: A list, to which a :exc:`~rply.ParsingError` is
+                       appended for every syntax error reported to the error
+                       handler. Like with yacc, errors within three tokens of
+                       the last one aren't reported, they're usually caused by
+                       it.
+        """
+        if isinstance(tokenizer, TokenBatch):
+            tokenizer = iter(tokenizer)
 
+        session = self.start(state, errors)
+        while True:
+            try:
+                lookahead = next(tokenizer)
+            except StopIteration:
+                lookahead = None
             if lookahead is None:
-                if lookaheadstack:
-                    lookahead = lookaheadstack.pop()
-                else:
-                    try:
-                        lookahead = next(tokenizer)
-                    except StopIteration:
-                        lookahead = None
+                return session.finish()
+            session.feed(lookahead)
+
+    def parse_async(self, tokenizer, state=None, errors=None):
+        """
+        Returns a coroutine, which parses the tokens produced by the
+        asynchronous iterator `tokenizer`, for example one returned by
+        :meth:`~rply.lexer.Lexer.lex_async`. Requires Python 3.5 or later.
+        """
+        from rply.aio import parse_async
+
+        return parse_async(self, tokenizer, state, errors)
+
+    def parse_incremental(self, lexer, source, state=None, reuse_moved=False):
+        """
+        Lexes and parses `source` and returns an
+        :class:`~rply.incremental.IncrementalParse` with the tokens and the
+        result, whose `edit` method parses the source after an edit again,
+        reusing the tokens and the values of productions the edit didn't
+        affect.
+
+        The values of productions after the edit are only reused if the edit
+        didn't move their tokens, unless `reuse_moved` is true. Only pass it,
+        if the values don't depend on the positions of their tokens.
+
+        An edit still takes time linear in the size of the source, to move
+        the positions of the tokens after it and the productions recorded for
+        them, and without `reuse_moved`, an edit that changes the length of
+        the text parses everything after it again.
+        """
+        from rply.incremental import IncrementalParse
+
+        parse = IncrementalParse(self, lexer, source, state, reuse_moved)
+        parse._parse(list(lexer.lex(source)), {})
+        return parse
+
+    def parse_many(self, items, lexer=None, workers=None, chunksize=1,
+                   state=None):
+        """
+        Parses many independent inputs in a pool of `workers` processes, by
+        default one per CPU, and returns a list with a `(result, errors)`
+        tuple for every item, in order.
+
+        If a `lexer` is given, the items are sources it lexes, otherwise they
+        are lists of tokens or :class:`~rply.token.TokenBatch` instances.
+        `errors` is a list of the syntax errors reported for the item, like
+        the `errors` argument of :meth:`parse` collects them. If the item
+        couldn't be parsed, the exception raised is appended to it as well
+        and the result is `None`.
+
+        Items are sent to the workers `chunksize` at a time. The parser and
+        the lexer are passed to every worker once, when it's started. Where
+        the platform supports forking, workers inherit them, otherwise they
+        are pickled, which only works if production functions and the error
+        handler are module-level functions with unique names. Every worker
+        gets its own copy of `state`, changes to it aren't seen here.
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1:
+            return [_parse_one(self, lexer, state, item) for item in items]
+
+        context = multiprocessing
+        if hasattr(multiprocessing, "get_context"):
+            if "fork" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("fork")
+        pool = context.Pool(workers, _init_worker, (self, lexer, state))
+        try:
+            return list(pool.imap(_parse_item, items, chunksize))
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+class ParserSession(object):
+    """
+    An in-progress parse, which keeps the parser's stacks between calls to
+    :meth:`feed`. Sessions are independent from each other, so any number of
+    them can be driven by the same parser at the same time.
+
+    Syntax errors are collected in :attr:`errors`.
+    """
+    def __init__(self, parser, state, errors=None):
+        self.parser = parser
+        self.state = state
+        self.errors = errors if errors is not None else []
+        self.statestack = [0]
+        self.symstack = [Token("$end", "$end")]
+        self.current_state = 0
+        self.finished = False
+        self.result = None
+        # The number of tokens left to shift, until the parser has recovered
+        # from the last error. Errors before then aren't reported.
+        self.recovering = 0
+        self.error_token = None
+        # Productions that don't depend on the lookahead are reduced right
+        # away, before the first token is needed.
+        self._run(None)
+
+    def feed(self, token):
+        """
+        Parses the next token, reducing all productions that can be reduced
+        until another token is needed.
+        """
+        if self.finished:
+            raise ValueError("Cannot feed tokens to a finished parse.")
+        self._run(token)
+
+    def finish(self):
+        """
+        Signals the end of the input and returns the result of the parse.
+        """
+        if not self.finished:
+            self._run(Token("$end", "$end"))
+        return self.result
 
+    def _run(self, lookahead):
+        lr_table = self.parser.lr_table
+        productions = lr_table.grammar.productions
+        default_reductions = lr_table.default_reduction_table
+        action_base = lr_table.action_base
+        action_check = lr_table.action_check
+        action_value = lr_table.action_value
+        goto_base = lr_table.goto_base
+        goto_value = lr_table.goto_value
+        prod_lengths = lr_table.prod_lengths
+        prod_nonterminals = lr_table.prod_nonterminals
+        symstack = self.symstack
+        statestack = self.statestack
+        state = self.state
+
+        current_state = self.current_state
+        tid = -1
+        while True:
+            t = default_reductions[current_state]
+            if not t:
                 if lookahead is None:
-                    lookahead = Token("$end", "$end")
+                    self.current_state = current_state
+                    return
 
-            ltype = lookahead.gettokentype()
-            if ltype in self.lr_table.lr_action[current_state]:
-                t = self.lr_table.lr_action[current_state][ltype]
+                if tid < 0:
+                    tid = lr_table.terminal_ids.get(
+                        lookahead.gettokentype(), -1
+                    )
+                i = action_base[current_state] + tid
+                if tid < 0 or action_check[i] != tid:
+                    self.current_state = current_state
+                    lookahead = self._recover(lookahead)
+                    current_state = self.current_state
+                    tid = -1
+                    continue
+                t = action_value[i]
                 if t > 0:
                     statestack.append(t)
                     current_state = t
                     symstack.append(lookahead)
                     lookahead = None
+                    tid = -1
+                    if self.recovering:
+                        self.recovering -= 1
                     continue
-                elif t < 0:
-                    current_state = self._reduce_production(
-                        t, symstack, statestack, state
-                    )
-                    continue
-                else:
-                    n = symstack[-1]
-                    return n
+                elif t == 0:
+                    self.current_state = current_state
+                    self.finished = True
+                    self.result = symstack[-1]
+                    return
+
+            # reduce a symbol on the stack and emit a production
+            start = len(symstack) - prod_lengths[-t]
+            assert start >= 0
+            targ = symstack[start:]
+            del symstack[start:]
+            del statestack[start:]
+            p = productions[-t]
+            if state is None:
+                value = p.func(targ)
             else:
-                # TODO: actual error handling here
-                if self.error_handler is not None:
-                    if state is None:
-                        self.error_handler(lookahead)
-                    else:
-                        self.error_handler(state, lookahead)
-                    raise AssertionError("For now, error_handler must raise.")
+                value = p.func(state, targ)
+            symstack.append(value)
+            current_state = goto_value[
+                goto_base[statestack[-1]] + prod_nonterminals[-t]
+            ]
+            statestack.append(current_state)
+
+    def _recover(self, lookahead):
+        """
+        Handles a syntax error at `lookahead`. Shifts `error` and returns the
+        lookahead to continue with, which is `None` if it was discarded, or
+        raises the error if the parser can't recover from it.
+        """
+        error = ParsingError(None, lookahead.getsourcepos())
+        if self.recovering == 3:
+            # Nothing was shifted since error, so shifting it again wouldn't
+            # help. The lookahead is discarded, unless it's the end of the
+            # input. Like with yacc, errors after shifting a token or two are
+            # handled by shifting error again, but aren't reported.
+            if lookahead.gettokentype() == "$end":
+                raise error
+            lookahead = None
+        elif not self.recovering:
+            error_handler = self.parser.error_handler
+            if error_handler is not None:
+                if self.state is None:
+                    error_handler(lookahead)
                 else:
-                    raise ParsingError(None, lookahead.getsourcepos())
-
-    def _reduce_production(self, t, symstack, statestack, state):
-        # reduce a symbol on the stack and emit a production
-        p = self.lr_table.grammar.productions[-t]
-        pname = p.name
-        plen = p.getlength()
-        start = len(symstack) + (-plen - 1)
-        assert start >= 0
-        targ = symstack[start + 1:]
-        start = len(symstack) + (-plen)
-        assert start >= 0
-        del symstack[start:]
-        del statestack[start:]
-        if state is None:
-            value = p.func(targ)
-        else:
-            value = p.func(state, targ)
-        symstack.append(value)
-        current_state = self.lr_table.lr_goto[statestack[-1]][pname]
-        statestack.append(current_state)
-        return current_state
+                    error_handler(self.state, lookahead)
+            self.errors.append(error)
+            # Productions get the token the error occurred at as value of
+            # error, for as long as the parser is recovering from it.
+            self.error_token = Token(
+                "error", lookahead.getstr(), lookahead.getsourcepos()
+            )
+
+        lr_table = self.parser.lr_table
+        error_id = lr_table.terminal_ids["error"]
+        action_check = lr_table.action_check
+        action_value = lr_table.action_value
+        statestack = self.statestack
+        symstack = self.symstack
+        while True:
+            i = lr_table.action_base[statestack[-1]] + error_id
+            if action_check[i] == error_id and action_value[i] > 0:
+                break
+            if len(statestack) == 1:
+                raise error
+            statestack.pop()
+            symstack.pop()
+
+        self.current_state = action_value[i]
+        statestack.append(self.current_state)
+        symstack.append(self.error_token)
+        self.recovering = 3
+        return lookahead
+
+
+_worker_parser = None
+
+
+def _init_worker(parser, lexer, state):
+    global _worker_parser
+    _worker_parser = (parser, lexer, state)
+
+
+def _parse_item(item):
+    parser, lexer, state = _worker_parser
+    return _parse_one(parser, lexer, state, item)
+
+
+def _parse_one(parser, lexer, state, item):
+    """
+    Parses one item for :meth:`LRParser.parse_many` and returns its result
+    and errors.
+    """
+    errors = []
+    try:
+        if lexer is not None:
+            item = lexer.lex(item)
+        elif not isinstance(item, TokenBatch):
+            item = iter(item)
+        return parser.parse(item, state, errors), errors
+    except Exception as e:
+        # A syntax error the parser couldn't recover from is already there.
+        if not errors or errors[-1] is not e:
+            errors.append(e)
+        return None, errors
@@ -1,21 +1,40 @@
+import copy
 import errno
 import hashlib
 import json
+import marshal
+import mmap
 import os
+import re
+import struct
 import sys
 import tempfile
+import time
 import warnings
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from appdirs import AppDirs
 
+from rply.codegen import generate_parser_module
 from rply.errors import ParserGeneratorError, ParserGeneratorWarning
 from rply.grammar import Grammar
 from rply.parser import LRParser
-from rply.utils import Counter, IdentityDict, iteritems, itervalues
+from rply.utils import (
+    int_array, int_array_from_bytes, int_array_to_bytes, iteritems, itervalues
+)
 
 
 LARGE_VALUE = sys.maxsize
 
+# time.perf_counter only exists on Python 3.3 and newer.
+_clock = getattr(time, "perf_counter", time.time)
+
+INT_SIZE = array("i").itemsize
+MAPPED_TABLE_MAGIC = b"rply-lr2"
+MAPPED_TABLE_HEADER = struct.Struct("<8sI")
+
 
 class ParserGenerator(object):
     """
@@ -31,7 +50,10 @@ class ParserGenerator(object):
                        precedence.
     :param cache_id: A string specifying an ID for caching.
     """
-    VERSION = 1
+    VERSION = 2
+
+    #: Tables built in this process, shared by all instances.
+    table_cache = None
 
     def __init__(self, tokens, precedence=[], cache_id=None):
         self.tokens = tokens
@@ -91,8 +113,10 @@ class ParserGenerator(object):
         Sets the error handler that is called with the state (if passed to the
         parser) and the token the parser errored on.
 
-        Currently error handlers must raise an exception. If an error handler
-        is not defined, a :exc:`rply.ParsingError` will be raised.
+        If the error handler returns, or isn't defined, the parser recovers
+        from the error, if the grammar has productions with the `error`
+        terminal that allow it to. Otherwise a :exc:`rply.ParsingError` will
+        be raised.
         """
         self.error_handler = func
         return func
@@ -111,43 +135,113 @@ class ParserGenerator(object):
             hasher.update(json.dumps(p.prod).encode())
         return hasher.hexdigest()
 
-    def serialize_table(self, table):
-        return {
-            "lr_action": table.lr_action,
-            "lr_goto": table.lr_goto,
+    def serialize_packed_table(self, table, grammar_hash):
+        """
+        Returns the tables of `table` in the binary cache format, which is
+        :mod:`marshal` data containing the packed tables as raw bytes.
+        """
+        data = table.packed_data()
+        data["hash"] = grammar_hash
+        return marshal.dumps(data)
+
+    def serialize_mapped_table(self, table, grammar_hash):
+        """
+        Returns the contents of a file :class:`MappedLRTable` can map for
+        `table`: a header and marshalled metadata, followed by the packed
+        tables as native integers.
+        """
+        arrays = []
+        offset = 0
+        chunks = []
+        for name in LRTable.PACKED_ARRAYS:
+            data = int_array_to_bytes(getattr(table, name))
+            arrays.append((name, offset, len(data)))
+            chunks.append(data)
+            offset += len(data)
+        metadata = marshal.dumps({
+            "hash": grammar_hash,
+            "byteorder": sys.byteorder,
+            "itemsize": INT_SIZE,
+            "terminal_ids": table.terminal_ids,
+            "nonterminal_ids": table.nonterminal_ids,
             "sr_conflicts": table.sr_conflicts,
             "rr_conflicts": table.rr_conflicts,
-            "default_reductions": table.default_reductions,
-            "start": table.grammar.start,
-            "terminals": sorted(table.grammar.terminals),
-            "precedence": table.grammar.precedence,
-            "productions": [
-                (p.name, p.prod, p.prec) for p in table.grammar.productions
-            ],
-        }
+            "arrays": arrays,
+        })
+        header = MAPPED_TABLE_HEADER.pack(MAPPED_TABLE_MAGIC, len(metadata))
+        # Align the tables, so that they can be accessed as integers.
+        padding = -(len(header) + len(metadata)) % 8
+        return b"".join([header, metadata, b"\0" * padding] + chunks)
+
+    def load_packed_table(self, g, grammar_hash, serialized):
+        """
+        Returns the LRTable stored in `serialized`, in the format returned by
+        :meth:`serialize_packed_table`, or `None` if it isn't valid for the
+        grammar with the given hash.
+        """
+        try:
+            data = marshal.loads(serialized)
+        except (EOFError, TypeError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("hash") != grammar_hash:
+            return None
+        return LRTable.from_packed(g, data)
+
+    def build(self, profile=None):
+        """
+        Returns a parser for the grammar.
 
-    def data_is_valid(self, g, data):
-        if g.start != data["start"]:
-            return False
-        if sorted(g.terminals) != data["terminals"]:
-            return False
-        if sorted(g.precedence) != sorted(data["precedence"]):
-            return False
-        for key, (assoc, level) in iteritems(g.precedence):
-            if data["precedence"][key] != [assoc, level]:
-                return False
-        if len(g.productions) != len(data["productions"]):
-            return False
-        for p, (name, prod, (assoc, level)) in zip(g.productions, data["productions"]):
-            if p.name != name:
-                return False
-            if p.prod != prod:
-                return False
-            if p.prec != (assoc, level):
-                return False
-        return True
-
-    def build(self):
+        :param profile: If true, the time spent in each phase of the build is
+                        measured. A :class:`BuildProfile` with the results is
+                        passed to `profile` if it is callable, otherwise its
+                        report is written to `sys.stderr`.
+        """
+        build_profile = BuildProfile() if profile else None
+        g = self._make_grammar()
+        table = self._build_table(g, build_profile)
+        self._warn_conflicts(table)
+        if profile:
+            self._report_profile(profile, build_profile)
+        return LRParser(table, self.error_handler)
+
+    def build_mapped(self, path, profile=None):
+        """
+        Like :meth:`build`, but stores the parser's tables in the file at
+        `path` and memory-maps it, instead of keeping them in memory. All
+        processes using the same file share one copy of the tables through the
+        page cache and only the first one has to build them. If the file
+        exists but is for a different grammar, it is replaced.
+
+        The tables of the returned parser don't have the `lr_action` and
+        `lr_goto` dictionaries, only what is needed to parse.
+        """
+        build_profile = BuildProfile() if profile else None
+        g = self._make_grammar()
+        grammar_hash = self.compute_grammar_hash(g)
+        with _phase(build_profile, "cache read"):
+            table = MappedLRTable.open(g, path, grammar_hash)
+        if table is None:
+            packed = self._build_table(g, build_profile)
+            with _phase(build_profile, "cache write"):
+                self._write_cache(
+                    os.path.dirname(os.path.abspath(path)), path,
+                    self.serialize_mapped_table(packed, grammar_hash)
+                )
+                table = MappedLRTable.open(g, path, grammar_hash) or packed
+        elif build_profile is not None:
+            build_profile.count("disk cache hits")
+        self._warn_conflicts(table)
+        if profile:
+            self._report_profile(profile, build_profile)
+        return LRParser(table, self.error_handler)
+
+    def _report_profile(self, profile, build_profile):
+        if callable(profile):
+            profile(build_profile)
+        else:
+            sys.stderr.write(build_profile.report())
+
+    def _make_grammar(self):
         g = Grammar(self.tokens)
 
         for level, (assoc, terms) in enumerate(self.precedence, 1):
@@ -163,40 +257,56 @@ class ParserGenerator(object):
             warnings.warn(
                 "Token %r is unused" % unused_term,
                 ParserGeneratorWarning,
-                stacklevel=2
+                stacklevel=3
             )
         for unused_prod in g.unused_productions():
             warnings.warn(
                 "Production %r is not reachable" % unused_prod,
                 ParserGeneratorWarning,
-                stacklevel=2
+                stacklevel=3
             )
+        return g
 
-        g.build_lritems()
-        g.compute_first()
-        g.compute_follow()
+    def _build_table(self, g, profile=None):
+        grammar_hash = self.compute_grammar_hash(g)
+        table = self.table_cache.get(grammar_hash)
+        if table is not None:
+            if profile is not None:
+                profile.count("table cache hits")
+            return table.with_grammar(g)
 
-        table = None
         if self.cache_id is not None:
             cache_dir = AppDirs("rply").user_cache_dir
             cache_file = os.path.join(
                 cache_dir,
-                "%s-%s-%s.json" % (
-                    self.cache_id, self.VERSION, self.compute_grammar_hash(g)
-                )
+                "%s-%s-%s.marshal" % (self.cache_id, self.VERSION, grammar_hash)
             )
 
             if os.path.exists(cache_file):
-                with open(cache_file) as f:
-                    data = json.load(f)
-                if self.data_is_valid(g, data):
-                    table = LRTable.from_cache(g, data)
+                with _phase(profile, "cache read"):
+                    with open(cache_file, "rb") as f:
+                        table = self.load_packed_table(g, grammar_hash, f.read())
+                if table is not None and profile is not None:
+                    profile.count("disk cache hits")
         if table is None:
-            table = LRTable.from_grammar(g)
+            with _phase(profile, "build_lritems"):
+                g.build_lritems()
+            with _phase(profile, "compute_first"):
+                g.compute_first()
+            with _phase(profile, "compute_follow"):
+                g.compute_follow()
+            table = LRTable.from_grammar(g, profile)
 
             if self.cache_id is not None:
-                self._write_cache(cache_dir, cache_file, table)
-
+                with _phase(profile, "cache write"):
+                    self._write_cache(
+                        cache_dir, cache_file,
+                        self.serialize_packed_table(table, grammar_hash)
+                    )
+        self.table_cache.put(grammar_hash, table)
+        return table
+
+    def _warn_conflicts(self, table):
         if table.sr_conflicts:
             warnings.warn(
                 "%d shift/reduce conflict%s" % (
@@ -204,7 +314,7 @@ class ParserGenerator(object):
                     "s" if len(table.sr_conflicts) > 1 else ""
                 ),
                 ParserGeneratorWarning,
-                stacklevel=2,
+                stacklevel=3,
             )
         if table.rr_conflicts:
             warnings.warn(
@@ -213,11 +323,30 @@ class ParserGenerator(object):
                     "s" if len(table.rr_conflicts) > 1 else ""
                 ),
                 ParserGeneratorWarning,
-                stacklevel=2,
+                stacklevel=3,
             )
-        return LRParser(table, self.error_handler)
 
-    def _write_cache(self, cache_dir, cache_file, table):
+    def generate_module(self):
+        """
+        Builds the parser and returns the source of a Python module, which
+        contains it with its tables as constants.
+
+        Calling the module's `build` function with this ParserGenerator returns
+        a parser with the same `parse` method as the one returned by
+        :meth:`build`, without having to analyze the grammar again. This way
+        parsers can be generated ahead of time and shipped as part of a
+        package::
+
+            with open("myparser.py", "w") as f:
+                f.write(pg.generate_module())
+
+            # later, after defining the productions of pg:
+            import myparser
+            parser = myparser.build(pg)
+        """
+        return generate_parser_module(self, self.build().lr_table)
+
+    def _write_cache(self, cache_dir, cache_file, data):
         if not os.path.exists(cache_dir):
             try:
                 os.makedirs(cache_dir, mode=0o0700)
@@ -226,11 +355,172 @@ class ParserGenerator(object):
                     return
                 raise
 
-        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False, mode="w") as f:
-            json.dump(self.serialize_table(table), f)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+            f.write(data)
         os.rename(f.name, cache_file)
 
 
+class LRTableCache(object):
+    """
+    A cache of the last `maxsize` tables built, keyed by the hash of their
+    grammar, which :meth:`ParserGenerator.build` consults before building or
+    loading a table.
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._tables = OrderedDict()
+
+    def __len__(self):
+        return len(self._tables)
+
+    def get(self, grammar_hash):
+        table = self._tables.pop(grammar_hash, None)
+        if table is not None:
+            self._tables[grammar_hash] = table
+        return table
+
+    def put(self, grammar_hash, table):
+        self._tables.pop(grammar_hash, None)
+        self._tables[grammar_hash] = table
+        while len(self._tables) > self.maxsize:
+            self._tables.popitem(last=False)
+
+    def invalidate(self, grammar_hash=None):
+        """
+        Removes the table for the grammar with the given hash from the cache,
+        or all tables if no hash is given.
+        """
+        if grammar_hash is None:
+            self._tables.clear()
+        else:
+            self._tables.pop(grammar_hash, None)
+
+
+ParserGenerator.table_cache = LRTableCache()
+
+
+class BuildProfile(object):
+    """
+    The wall time spent in each phase of building a parser and counts of what
+    was built, as passed to the `profile` callback of
+    :meth:`ParserGenerator.build`.
+
+    `phases` maps the name of each phase to a ``[seconds, calls]`` list and
+    `counts` maps names like ``"states"`` or ``"table cache hits"`` to
+    integers, both in the order they were first recorded. Phases that didn't
+    run, because the table was cached, are missing.
+    """
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.counts = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start = _clock()
+        try:
+            yield
+        finally:
+            self.add(name, _clock() - start)
+
+    def add(self, name, seconds):
+        phase = self.phases.setdefault(name, [0.0, 0])
+        phase[0] += seconds
+        phase[1] += 1
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    @property
+    def total(self):
+        return sum([seconds for seconds, _ in itervalues(self.phases)])
+
+    def report(self):
+        """
+        Returns the results as a table, with one phase or count per line.
+        """
+        lines = ["%-30s %6s %10s" % ("phase", "calls", "seconds")]
+        for name, (seconds, calls) in iteritems(self.phases):
+            lines.append("%-30s %6d %10.4f" % (name, calls, seconds))
+        lines.append("%-30s %6s %10.4f" % ("total", "", self.total))
+        for name, n in iteritems(self.counts):
+            lines.append("%-30s %6d" % (name, n))
+        return "\n".join(lines) + "\n"
+
+
+def _phase(profile, name):
+    # Measures the phase only if a profile is being recorded.
+    if profile is None:
+        return _no_phase()
+    return profile.phase(name)
+
+
+@contextmanager
+def _no_phase():
+    yield
+
+
+class MappedLRTable(object):
+    """
+    The packed tables of an :class:`LRTable`, which are read from a
+    memory-mapped file written by :meth:`ParserGenerator.build_mapped`
+    instead of being copied into memory.
+    """
+    def __init__(self, grammar, mapping, metadata, offset):
+        self.grammar = grammar
+        self.mapping = mapping
+        self.terminal_ids = metadata["terminal_ids"]
+        self.nonterminal_ids = metadata["nonterminal_ids"]
+        self.sr_conflicts = metadata["sr_conflicts"]
+        self.rr_conflicts = metadata["rr_conflicts"]
+        for name, start, size in metadata["arrays"]:
+            start += offset
+            setattr(self, name, _int_view(mapping, start, start + size))
+
+    @classmethod
+    def open(cls, grammar, path, grammar_hash):
+        """
+        Maps the tables in the file at `path`. Returns `None`, if the file
+        doesn't exist or isn't valid for the grammar with the given hash.
+        """
+        try:
+            f = open(path, "rb")
+        except (IOError, OSError):
+            return None
+        with f:
+            try:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError):
+                return None
+        size = MAPPED_TABLE_HEADER.size
+        if len(mapping) < size:
+            return None
+        magic, metadata_size = MAPPED_TABLE_HEADER.unpack(mapping[:size])
+        if magic != MAPPED_TABLE_MAGIC:
+            return None
+        try:
+            metadata = marshal.loads(mapping[size:size + metadata_size])
+        except (EOFError, TypeError, ValueError):
+            return None
+        if not isinstance(metadata, dict):
+            return None
+        found = (
+            metadata.get("hash"), metadata.get("byteorder"),
+            metadata.get("itemsize"),
+        )
+        if found != (grammar_hash, sys.byteorder, INT_SIZE):
+            return None
+        offset = size + metadata_size
+        offset += -offset % 8
+        return cls(grammar, mapping, metadata, offset)
+
+
+def _int_view(mapping, start, end):
+    if hasattr(memoryview, "cast"):
+        return memoryview(mapping)[start:end].cast("i")
+    # Python 2 can't view memory as integers, so the table has to be copied.
+    return int_array_from_bytes(mapping[start:end])
+
+
 def digraph(X, R, FP):
     N = dict.fromkeys(X, 0)
     stack = []
@@ -252,9 +542,7 @@ def traverse(x, N, stack, F, X, R, FP):
         if N[y] == 0:
             traverse(y, N, stack, F, X, R, FP)
         N[x] = min(N[x], N[y])
-        for a in F.get(y, []):
-            if a not in F[x]:
-                F[x].append(a)
+        F[x] |= F.get(y, 0)
     if N[x] == d:
         N[stack[-1]] = LARGE_VALUE
         F[stack[-1]] = F[x]
@@ -265,44 +553,207 @@ def traverse(x, N, stack, F, X, R, FP):
             element = stack.pop()
 
 
+def pack_rows(rows, ncolumns):
+    """
+    Packs sparse rows, each a list of `(column, value)` pairs sorted by
+    column, into a single vector using row displacement: every row gets a base
+    offset, at which it's overlaid with the other rows, so that none of their
+    entries collide. Identical rows share the same base.
+
+    Returns the lists `base`, `check` and `value`. The value of a row `r` in
+    column `c` is `value[base[r] + c]`, if `check[base[r] + c] == c`, otherwise
+    the row has no entry for that column. All indexes computed this way for
+    columns less than `ncolumns` are within bounds.
+    """
+    base = [0] * len(rows)
+    check = []
+    value = []
+    used_bases = set()
+    bases_by_row = {}
+    # One byte per slot, which is 1 if the slot is taken. There are always
+    # `ncolumns` free slots at the end, so that every row fits somewhere.
+    occupied = bytearray(ncolumns)
+    fit_patterns = {}
+    for r in sorted(range(len(rows)), key=lambda r: -len(rows[r])):
+        row = rows[r]
+        key = tuple(row)
+        if key in bases_by_row:
+            base[r] = bases_by_row[key]
+            continue
+        if not row:
+            b = 0
+            while b in used_bases:
+                b += 1
+        else:
+            columns = tuple([c for c, _ in row])
+            if columns not in fit_patterns:
+                fit_patterns[columns] = _fit_pattern(columns)
+            pattern = fit_patterns[columns]
+            start = max(occupied.find(b"\0"), columns[0])
+            while True:
+                # The regex engine finds the first gap the row fits into much
+                # faster than trying every base in Python would.
+                b = pattern.search(occupied, start).start() - columns[0]
+                if b not in used_bases:
+                    break
+                start = b + columns[0] + 1
+            end = b + columns[-1] + 1
+            if end > len(check):
+                check.extend([-1] * (end - len(check)))
+                value.extend([0] * (end - len(value)))
+                occupied.extend(bytearray(len(check) + ncolumns - len(occupied)))
+            for c, v in row:
+                check[b + c] = c
+                value[b + c] = v
+                occupied[b + c] = 1
+        used_bases.add(b)
+        bases_by_row[key] = base[r] = b
+    # Pad the vectors, so that indexing them never goes out of bounds.
+    size = max(base) + ncolumns if base else 0
+    if len(check) < size:
+        check.extend([-1] * (size - len(check)))
+        value.extend([0] * (size - len(value)))
+    return base, check, value
+
+
+def _fit_pattern(columns):
+    """
+    Returns a regular expression matching a sequence of slots in the
+    `occupied` vector of :func:`pack_rows`, in which the given columns are
+    free.
+    """
+    parts = ["\\x00"]
+    for prev, c in zip(columns, columns[1:]):
+        parts.append(".{%d}\\x00" % (c - prev - 1))
+    return re.compile("".join(parts).encode("ascii"), re.DOTALL)
+
+
 class LRTable(object):
+    PACKED_ARRAYS = [
+        "action_base", "action_check", "action_value", "goto_base",
+        "goto_value", "prod_lengths", "prod_nonterminals",
+        "default_reduction_table",
+    ]
+
     def __init__(self, grammar, lr_action, lr_goto, default_reductions,
-                 sr_conflicts, rr_conflicts):
+                 sr_conflicts, rr_conflicts, packed=None):
         self.grammar = grammar
         self.lr_action = lr_action
         self.lr_goto = lr_goto
         self.default_reductions = default_reductions
         self.sr_conflicts = sr_conflicts
         self.rr_conflicts = rr_conflicts
-
-    @classmethod
-    def from_cache(cls, grammar, data):
-        lr_action = [
-            dict([(str(k), v) for k, v in iteritems(action)])
-            for action in data["lr_action"]
+        if packed is None:
+            self._pack()
+        else:
+            self.terminal_ids = packed["terminal_ids"]
+            self.nonterminal_ids = packed["nonterminal_ids"]
+            for name in self.PACKED_ARRAYS:
+                setattr(self, name, int_array_from_bytes(packed[name]))
+
+    def _pack(self):
+        """
+        Builds the compact tables used by the parser, in which terminals and
+        nonterminals are numbered and actions and gotos are looked up in flat
+        integer arrays, instead of dictionaries keyed by symbol name.
+        """
+        self.terminal_ids = {"$end": 0}
+        for term in sorted(self.grammar.terminals):
+            self.terminal_ids[term] = len(self.terminal_ids)
+        self.nonterminal_ids = {}
+        for nonterm in sorted(self.grammar.nonterminals):
+            self.nonterminal_ids[nonterm] = len(self.nonterminal_ids)
+
+        # The actions of states with a default reduction are never looked up.
+        action_rows = [
+            [] if default else sorted([
+                (self.terminal_ids[a], v) for a, v in iteritems(action)
+            ])
+            for action, default in zip(self.lr_action, self.default_reductions)
         ]
-        lr_goto = [
-            dict([(str(k), v) for k, v in iteritems(goto)])
-            for goto in data["lr_goto"]
+        base, check, value = pack_rows(
+            action_rows, len(self.terminal_ids)
+        )
+        self.action_base = int_array(base)
+        self.action_check = int_array(check)
+        self.action_value = int_array(value)
+
+        goto_rows = [
+            sorted([(self.nonterminal_ids[n], v) for n, v in iteritems(goto)])
+            for goto in self.lr_goto
         ]
+        # Gotos are only ever looked up for nonterminals a state has a goto
+        # for, so they don't need to be checked.
+        base, _, value = pack_rows(goto_rows, len(self.nonterminal_ids))
+        self.goto_base = int_array(base)
+        self.goto_value = int_array(value)
+
+        self.prod_lengths = int_array(
+            [0] + [p.getlength() for p in self.grammar.productions[1:]]
+        )
+        self.prod_nonterminals = int_array(
+            [0] + [
+                self.nonterminal_ids[p.name]
+                for p in self.grammar.productions[1:]
+            ]
+        )
+        self.default_reduction_table = int_array(self.default_reductions)
+
+    def with_grammar(self, grammar):
+        """
+        Returns a copy of this table, that calls the production functions of
+        `grammar`, which must have the same productions as this table's.
+        """
+        table = copy.copy(self)
+        table.grammar = grammar
+        return table
+
+    def packed_data(self):
+        """
+        Returns a dict with everything needed to recreate this table with
+        :meth:`from_packed`, with the packed tables as bytes.
+        """
+        data = {
+            "lr_action": self.lr_action,
+            "lr_goto": self.lr_goto,
+            "default_reductions": self.default_reductions,
+            "sr_conflicts": self.sr_conflicts,
+            "rr_conflicts": self.rr_conflicts,
+            "terminal_ids": self.terminal_ids,
+            "nonterminal_ids": self.nonterminal_ids,
+        }
+        for name in self.PACKED_ARRAYS:
+            data[name] = int_array_to_bytes(getattr(self, name))
+        return data
+
+    @classmethod
+    def from_packed(cls, grammar, data):
         return LRTable(
             grammar,
-            lr_action,
-            lr_goto,
+            data["lr_action"],
+            data["lr_goto"],
             data["default_reductions"],
             data["sr_conflicts"],
-            data["rr_conflicts"]
+            data["rr_conflicts"],
+            packed=data,
         )
 
     @classmethod
-    def from_grammar(cls, grammar):
-        cidhash = IdentityDict()
-        goto_cache = {}
-        add_count = Counter()
-        C = cls.lr0_items(grammar, add_count, cidhash, goto_cache)
-
-        cls.add_lalr_lookaheads(grammar, C, add_count, cidhash, goto_cache)
-
+    def from_grammar(cls, grammar, profile=None):
+        if profile is None:
+            profile = BuildProfile()
+        with profile.phase("lr0_items"):
+            C, goto_table = cls.lr0_items(grammar)
+        profile.count("productions", len(grammar.productions))
+        profile.count("LR items", sum([len(p.lr_items) for p in grammar.productions]))
+        profile.count("states", len(C))
+        profile.count("items in states", sum([len(I) for I in C]))
+        # Every state is the closure of its kernel, computed exactly once.
+        profile.count("lr0_closure calls", len(C))
+
+        cls.add_lalr_lookaheads(grammar, C, goto_table, profile)
+
+        start = _clock()
         lr_action = [None] * len(C)
         lr_goto = [None] * len(C)
         sr_conflicts = []
@@ -356,8 +807,7 @@ class LRTable(object):
                     i = p.lr_index
                     a = p.prod[i + 1]
                     if a in grammar.terminals:
-                        g = cls.lr0_goto(I, a, add_count, goto_cache)
-                        j = cidhash.get(g, -1)
+                        j = goto_table[st].get(a, -1)
                         if j >= 0:
                             if a in st_action:
                                 r = st_action[a]
@@ -381,15 +831,8 @@ class LRTable(object):
                             else:
                                 st_action[a] = j
                                 st_actionp[a] = p
-            nkeys = set()
-            for ii in I:
-                for s in ii.unique_syms:
-                    if s in grammar.nonterminals:
-                        nkeys.add(s)
-            for n in nkeys:
-                g = cls.lr0_goto(I, n, add_count, goto_cache)
-                j = cidhash.get(g, -1)
-                if j >= 0:
+            for n, j in iteritems(goto_table[st]):
+                if n in grammar.nonterminals:
                     st_goto[n] = j
 
             lr_action[st] = st_action
@@ -400,80 +843,90 @@ class LRTable(object):
             actions = set(itervalues(actions))
             if len(actions) == 1 and next(iter(actions)) < 0:
                 default_reductions[state] = next(iter(actions))
-        return LRTable(grammar, lr_action, lr_goto, default_reductions, sr_conflicts, rr_conflicts)
+        profile.add("action table", _clock() - start)
+        with profile.phase("pack tables"):
+            return LRTable(grammar, lr_action, lr_goto, default_reductions, sr_conflicts, rr_conflicts)
 
     @classmethod
-    def lr0_items(cls, grammar, add_count, cidhash, goto_cache):
-        C = [cls.lr0_closure([grammar.productions[0].lr_next], add_count)]
-        for i, I in enumerate(C):
-            cidhash[I] = i
+    def lr0_items(cls, grammar):
+        """
+        Returns the LR(0) item sets and a list with a dict for every set,
+        mapping the symbols that can follow in it to the number of the set
+        reached by them.
+
+        Sets are identified by their kernel, the items they're reached with,
+        as a sorted tuple of item ids.
+        """
+        kernel = [grammar.productions[0].lr_next]
+        C = [cls.lr0_closure(kernel)]
+        state_ids = {cls.kernel_key(kernel): 0}
+        goto_table = []
 
         i = 0
         while i < len(C):
             I = C[i]
             i += 1
 
-            asyms = set()
-            for ii in I:
-                asyms.update(ii.unique_syms)
-            for x in asyms:
-                g = cls.lr0_goto(I, x, add_count, goto_cache)
-                if not g:
-                    continue
-                if g in cidhash:
-                    continue
-                cidhash[g] = len(C)
-                C.append(g)
-        return C
+            # The items moving past each symbol, in order of appearance, so
+            # that sets are numbered the same way every time.
+            symbols = []
+            kernels = {}
+            for p in I:
+                n = p.lr_next
+                if n is not None:
+                    x = n.lr_before
+                    if x not in kernels:
+                        symbols.append(x)
+                        kernels[x] = []
+                    kernels[x].append(n)
+
+            transitions = {}
+            for x in symbols:
+                key = cls.kernel_key(kernels[x])
+                j = state_ids.get(key, -1)
+                if j < 0:
+                    j = state_ids[key] = len(C)
+                    C.append(cls.lr0_closure(kernels[x]))
+                transitions[x] = j
+            goto_table.append(transitions)
+        return C, goto_table
 
     @classmethod
-    def lr0_closure(cls, I, add_count):
-        add_count.incr()
+    def kernel_key(cls, kernel):
+        return tuple(sorted([p.item_id for p in kernel]))
 
+    @classmethod
+    def lr0_closure(cls, I):
         J = I[:]
-        added = True
-        while added:
-            added = False
-            for j in J:
-                for x in j.lr_after:
-                    if x.lr0_added == add_count.value:
-                        continue
+        added = set()
+        for j in J:
+            for x in j.lr_after:
+                if x.number not in added:
+                    added.add(x.number)
                     J.append(x.lr_next)
-                    x.lr0_added = add_count.value
-                    added = True
         return J
 
     @classmethod
-    def lr0_goto(cls, I, x, add_count, goto_cache):
-        s = goto_cache.setdefault(x, IdentityDict())
-
-        gs = []
-        for p in I:
-            n = p.lr_next
-            if n and n.lr_before == x:
-                s1 = s.get(n)
-                if not s1:
-                    s1 = {}
-                    s[n] = s1
-                gs.append(n)
-                s = s1
-        g = s.get("$end")
-        if not g:
-            if gs:
-                g = cls.lr0_closure(gs, add_count)
-                s["$end"] = g
-            else:
-                s["$end"] = gs
-        return g
-
-    @classmethod
-    def add_lalr_lookaheads(cls, grammar, C, add_count, cidhash, goto_cache):
-        nullable = cls.compute_nullable_nonterminals(grammar)
-        trans = cls.find_nonterminal_transitions(grammar, C)
-        readsets = cls.compute_read_sets(grammar, C, trans, nullable, add_count, cidhash, goto_cache)
-        lookd, included = cls.compute_lookback_includes(grammar, C, trans, nullable, add_count, cidhash, goto_cache)
-        followsets = cls.compute_follow_sets(trans, readsets, included)
-        cls.add_lookaheads(lookd, followsets)
+    def add_lalr_lookaheads(cls, grammar, C, goto_table, profile=None):
+        if profile is None:
+            profile = BuildProfile()
+        # Sets of terminals are represented as integers, with one bit per
+        # terminal, while computing the lookaheads.
+        terminals = sorted(grammar.terminals) + ["$end"]
+        terminal_bits = dict([(t, 1 << i) for i, t in enumerate(terminals)])
+
+        with profile.phase("compute_nullable_nonterminals"):
+            nullable = cls.compute_nullable_nonterminals(grammar)
+        with profile.phase("find_nonterminal_transitions"):
+            trans = cls.find_nonterminal_transitions(grammar, C)
+        with profile.phase("compute_read_sets"):
+            readsets = cls.compute_read_sets(grammar, C, trans, nullable, goto_table, terminal_bits)
+        with profile.phase("compute_lookback_includes"):
+            lookd, included = cls.compute_lookback_includes(grammar, C, trans, nullable, goto_table)
+        with profile.phase("compute_follow_sets"):
+            followsets = cls.compute_follow_sets(trans, readsets, included)
+        with profile.phase("add_lookaheads"):
+            cls.add_lookaheads(lookd, followsets, terminals)
 
     @classmethod
     def compute_nullable_nonterminals(cls, grammar):
@@ -497,20 +950,22 @@ class LRTable(object):
     @classmethod
     def find_nonterminal_transitions(cls, grammar, C):
         trans = []
+        seen = set()
         for idx, state in enumerate(C):
             for p in state:
                 if p.lr_index < p.getlength() - 1:
                     t = (idx, p.prod[p.lr_index + 1])
-                    if t[1] in grammar.nonterminals and t not in trans:
+                    if t[1] in grammar.nonterminals and t not in seen:
+                        seen.add(t)
                         trans.append(t)
         return trans
 
     @classmethod
-    def compute_read_sets(cls, grammar, C, ntrans, nullable, add_count, cidhash, goto_cache):
+    def compute_read_sets(cls, grammar, C, ntrans, nullable, goto_table, terminal_bits):
         return digraph(
             ntrans,
-            R=lambda x: cls.reads_relation(C, x, nullable, add_count, cidhash, goto_cache),
-            FP=lambda x: cls.dr_relation(grammar, C, x, nullable, add_count, goto_cache)
+            R=lambda x: cls.reads_relation(C, x, nullable, goto_table),
+            FP=lambda x: cls.dr_relation(grammar, C, x, nullable, goto_table, terminal_bits)
         )
 
     @classmethod
@@ -522,27 +977,27 @@ class LRTable(object):
         )
 
     @classmethod
-    def dr_relation(cls, grammar, C, trans, nullable, add_count, goto_cache):
+    def dr_relation(cls, grammar, C, trans, nullable, goto_table, terminal_bits):
         state, N = trans
-        terms = []
+        terms = 0
 
-        g = cls.lr0_goto(C[state], N, add_count, goto_cache)
+        g = C[goto_table[state][N]]
         for p in g:
             if p.lr_index < p.getlength() - 1:
                 a = p.prod[p.lr_index + 1]
-                if a in grammar.terminals and a not in terms:
-                    terms.append(a)
+                if a in grammar.terminals:
+                    terms |= terminal_bits[a]
         if state == 0 and N == grammar.productions[0].prod[0]:
-            terms.append("$end")
+            terms |= terminal_bits["$end"]
         return terms
 
     @classmethod
-    def reads_relation(cls, C, trans, empty, add_count, cidhash, goto_cache):
+    def reads_relation(cls, C, trans, empty, goto_table):
         rel = []
         state, N = trans
 
-        g = cls.lr0_goto(C[state], N, add_count, goto_cache)
-        j = cidhash.get(g, -1)
+        j = goto_table[state][N]
+        g = C[j]
         for p in g:
             if p.lr_index < p.getlength() - 1:
                 a = p.prod[p.lr_index + 1]
@@ -551,7 +1006,7 @@ class LRTable(object):
         return rel
 
     @classmethod
-    def compute_lookback_includes(cls, grammar, C, trans, nullable, add_count, cidhash, goto_cache):
+    def compute_lookback_includes(cls, grammar, C, trans, nullable, goto_table):
         lookdict = {}
         includedict = {}
 
@@ -581,8 +1036,7 @@ class LRTable(object):
                         else:
                             includes.append((j, t))
 
-                    g = cls.lr0_goto(C[j], t, add_count, goto_cache)
-                    j = cidhash.get(g, -1)
+                    j = goto_table[j][t]
 
                 for r in C[j]:
                     if r.name != p.name:
@@ -603,11 +1057,23 @@ class LRTable(object):
         return lookdict, includedict
 
     @classmethod
-    def add_lookaheads(cls, lookbacks, followset):
+    def add_lookaheads(cls, lookbacks, followset, terminals):
+        lookaheads = {}
+        items = []
         for trans, lb in iteritems(lookbacks):
+            f = followset.get(trans, 0)
             for state, p in lb:
-                f = followset.get(trans, [])
-                laheads = p.lookaheads.setdefault(state, [])
-                for a in f:
-                    if a not in laheads:
-                        laheads.append(a)
+                key = state, p.item_id
+                if key not in lookaheads:
+                    lookaheads[key] = 0
+                    items.append((state, p))
+                lookaheads[key] |= f
+        for state, p in items:
+            bits = lookaheads[state, p.item_id]
+            laheads = p.lookaheads[state] = []
+            i = 0
+            while bits:
+                if bits & 1:
+                    laheads.append(terminals[i])
+                bits >>= 1
+                i += 1
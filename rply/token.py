@@ -1,3 +1,8 @@
+import re
+
+from rply.utils import text_type, we_are_translated
+
+
 class BaseBox(object):
     """
     A base class for polymorphic boxes that wrap parser results. Simply use
@@ -5,6 +10,7 @@ class BaseBox(object):
     parser. This is necessary because RPython unlike Python expects functions
     to always return objects of the same type.
     """
+    __slots__ = ()
     _attrs_ = []
 
 
@@ -18,6 +24,8 @@ class Token(BaseBox):
                        position of the first character in the source from which
                        this token was generated.
     """
+    __slots__ = ("name", "value", "source_pos")
+
     def __init__(self, name, value, source_pos=None):
         self.name = name
         self.value = value
@@ -51,6 +59,172 @@ class Token(BaseBox):
         return self.value
 
 
+class IndexedToken(Token):
+    """
+    A :class:`Token` that only stores the index of its first character in the
+    source. The :class:`SourcePosition` is computed when it's asked for,
+    using a :class:`LineIndex` shared by all tokens of the same source.
+
+    :param name: A string describing the kind of text represented.
+    :param value: The actual text represented.
+    :param idx: The index of the first character in the source.
+    :param line_index: The :class:`LineIndex` of the source.
+    """
+    __slots__ = ("idx", "line_index")
+
+    def __init__(self, name, value, idx, line_index):
+        self.name = name
+        self.value = value
+        self.idx = idx
+        self.line_index = line_index
+
+    @property
+    def source_pos(self):
+        return self.line_index.getsourcepos(self.idx)
+
+
+class TokenBatch(object):
+    """
+    Holds all tokens lexed from a source in parallel arrays, instead of one
+    :class:`Token` per token. Values and positions are only computed when
+    asked for.
+
+    :param names: A list of token names, indexed by token type id.
+    :param types: An array with the type id of every token.
+    :param starts: An array with the index of the first character of every
+                   token.
+    :param ends: An array with the index after the last character of every
+                 token.
+    :param source: The lexed source.
+    :param line_index: An optional :class:`LineIndex` for `source`.
+    """
+    def __init__(self, names, types, starts, ends, source, line_index=None):
+        self.names = names
+        self.types = types
+        self.starts = starts
+        self.ends = ends
+        self.source = source
+        if line_index is None:
+            line_index = LineIndex(source)
+        self.line_index = line_index
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, i):
+        """
+        Returns the token at `i` as an :class:`IndexedToken`.
+        """
+        return IndexedToken(
+            self.names[self.types[i]], self.getstr(i), self.starts[i],
+            self.line_index
+        )
+
+    def __iter__(self):
+        for i in range(len(self.types)):
+            yield self[i]
+
+    def gettokentype(self, i):
+        """
+        Returns the type or name of the token at `i`.
+        """
+        return self.names[self.types[i]]
+
+    def getstr(self, i):
+        """
+        Returns the string represented by the token at `i`.
+        """
+        return self.source[self.starts[i]:self.ends[i]]
+
+    def getsourcepos(self, i):
+        """
+        Returns a :class:`SourcePosition` instance, describing the position of
+        the first character of the token at `i`.
+        """
+        return self.line_index.getsourcepos(self.starts[i])
+
+
+_binary_newline_re = re.compile(b"\n")
+
+
+class LineIndex(object):
+    """
+    Computes line and column numbers of indices in a source string, by
+    binary searching the offsets at which lines start. Those offsets are
+    only collected up to the highest index asked for so far.
+
+    :param s: The source string or bytes-like object.
+    """
+    def __init__(self, s):
+        self.s = s
+        self.line_starts = [0]
+        self._scanned = 0
+        self._binary = (
+            not we_are_translated() and not isinstance(s, text_type)
+        )
+
+    def _find_newline(self, start, end):
+        if self._binary:
+            match = _binary_newline_re.search(self.s, start, end)
+            return match.start() if match is not None else -1
+        return self.s.find("\n", start, end)
+
+    def _scan_to(self, idx):
+        while self._scanned <= idx:
+            nl = self._find_newline(self._scanned, len(self.s))
+            if nl < 0:
+                self._scanned = len(self.s) + 1
+                break
+            self.line_starts.append(nl + 1)
+            self._scanned = nl + 1
+
+    def getsourcepos(self, idx):
+        """
+        Returns a :class:`SourcePosition` for the character at `idx`.
+        """
+        self._scan_to(idx)
+        lo = 0
+        hi = len(self.line_starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.line_starts[mid] <= idx:
+                lo = mid + 1
+            else:
+                hi = mid
+        return SourcePosition(idx, lo, idx - self.line_starts[lo - 1] + 1)
+
+    def edited(self, s, start, end, new_text):
+        """
+        Returns a :class:`LineIndex` for `s`, the source after the text
+        between the indices `start` and `end` was replaced by `new_text`. The
+        offsets found so far are moved instead of searched for again, only
+        `new_text` is searched for newlines.
+        """
+        index = LineIndex(s)
+        if self._scanned <= start:
+            index.line_starts = self.line_starts[:]
+            index._scanned = self._scanned
+            return index
+        # Offsets up to start follow newlines before the edit, those after
+        # end newlines after it.
+        line_starts = [i for i in self.line_starts if i <= start]
+        new_end = start + len(new_text)
+        nl = index._find_newline(start, new_end)
+        while nl >= 0:
+            line_starts.append(nl + 1)
+            nl = index._find_newline(nl + 1, new_end)
+        if self._scanned > end:
+            delta = new_end - end
+            line_starts.extend(
+                [i + delta for i in self.line_starts if i > end]
+            )
+            index._scanned = self._scanned + delta
+        else:
+            index._scanned = new_end
+        index.line_starts = line_starts
+        return index
+
+
 class SourcePosition(object):
     """
     Represents the position of a character in some source string.
@@ -62,6 +236,8 @@ class SourcePosition(object):
     The values passed to this object can be retrieved using the identically
     named attributes.
     """
+    __slots__ = ("idx", "lineno", "colno")
+
     def __init__(self, idx, lineno, colno):
         self.idx = idx
         self.lineno = lineno
@@ -1,54 +1,64 @@
 import sys
+from array import array
 
-if sys.version_info >= (3, 3):
-    from collections.abc import MutableMapping
-else:
-    from collections import MutableMapping
-
+try:
+    from rpython.rlib.objectmodel import we_are_translated
+except ImportError:
+    def we_are_translated():
+        return False
 
-class IdentityDict(MutableMapping):
-    def __init__(self):
-        self._contents = {}
-        self._keepalive = []
 
-    def __getitem__(self, key):
-        return self._contents[id(key)][1]
+def _array_from_bytes(data):
+    a = array("i")
+    if hasattr(a, "frombytes"):
+        a.frombytes(data)
+    else:
+        a.fromstring(data)
+    return a
 
-    def __setitem__(self, key, value):
-        idx = len(self._keepalive)
-        self._keepalive.append(key)
-        self._contents[id(key)] = key, value, idx
 
-    def __delitem__(self, key):
-        del self._contents[id(key)]
-        for idx, obj in enumerate(self._keepalive):
-            if obj is key:
-                del self._keepalive[idx]
-                break
+def int_array_to_bytes(values):
+    a = array("i", values)
+    if hasattr(a, "tobytes"):
+        return a.tobytes()
+    return a.tostring()
 
-    def __len__(self):
-        return len(self._contents)
 
-    def __iter__(self):
-        for key, _, _ in itervalues(self._contents):
-            yield key
+try:
+    import rpython  # noqa: F401
+except ImportError:
+    def int_array(values):
+        return array("i", values)
 
+    def int_array_from_bytes(data):
+        return _array_from_bytes(data)
+else:
+    # RPython can't translate prebuilt arrays, but lists of ints are just as
+    # compact once translated.
+    def int_array(values):
+        return list(values)
 
-class Counter(object):
-    def __init__(self):
-        self.value = 0
+    def int_array_from_bytes(data):
+        return list(_array_from_bytes(data))
 
-    def incr(self):
-        self.value += 1
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:
+    import sre_constants  # noqa: F401
+    import sre_parse  # noqa: F401
 
 
 if sys.version_info >= (3,):
+    text_type = str
+
     def itervalues(d):
         return d.values()
 
     def iteritems(d):
         return d.items()
 else:
+    text_type = basestring  # noqa: F821
+
     def itervalues(d):
         return d.itervalues()
 
@@ -0,0 +1,99 @@
+import asyncio
+
+from pytest import raises
+
+from rply import LexerGenerator, LexingError, ParserGenerator
+
+from .utils import BoxInt
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def make_reader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+def build_lexer():
+    lg = LexerGenerator()
+    lg.add("NUMBER", r"\d+")
+    lg.add("PLUS", r"\+")
+    lg.ignore(r"\s+")
+    return lg.build()
+
+
+class TestAsyncLexer(object):
+    def test_lex_async(self):
+        lexer = build_lexer()
+
+        async def lex():
+            reader = await make_reader(b"12 +\n 345")
+            return [t async for t in lexer.lex_async(reader, chunk_size=2)]
+
+        tokens = run(lex())
+        assert [t.getstr() for t in tokens] == [b"12", b"+", b"345"]
+        assert tokens[2].getsourcepos().lineno == 2
+        assert tokens[2].getsourcepos().colno == 2
+
+    def test_error(self):
+        lexer = build_lexer()
+
+        async def lex():
+            reader = await make_reader(b"1 ?")
+            return [t async for t in lexer.lex_async(reader)]
+
+        with raises(LexingError) as excinfo:
+            run(lex())
+        assert excinfo.value.getsourcepos().idx == 2
+
+    def test_open_reader(self):
+        lexer = build_lexer()
+
+        async def lex():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"1 + 2")
+            tokens = lexer.lex_async(reader)
+            first = await asyncio.wait_for(tokens.__anext__(), 1)
+            second = await asyncio.wait_for(tokens.__anext__(), 1)
+            reader.feed_data(b"34")
+            reader.feed_eof()
+            return [first, second] + [t async for t in tokens]
+
+        tokens = run(lex())
+        assert [t.getstr() for t in tokens] == [b"1", b"+", b"234"]
+
+
+class TestAsyncParser(object):
+    def test_parse_async(self):
+        pg = ParserGenerator(["NUMBER", "PLUS"], precedence=[
+            ("left", ["PLUS"]),
+        ])
+
+        @pg.production("main : expr")
+        def main(p):
+            return p[0]
+
+        @pg.production("expr : expr PLUS expr")
+        def expr_plus(p):
+            return BoxInt(p[0].getint() + p[2].getint())
+
+        @pg.production("expr : NUMBER")
+        def expr_number(p):
+            return BoxInt(int(p[0].getstr()))
+
+        parser = pg.build()
+        lexer = build_lexer()
+
+        async def parse():
+            reader = await make_reader(b"1 + 2 + 39")
+            return await parser.parse_async(lexer.lex_async(reader))
+
+        assert run(parse()) == BoxInt(42)
@@ -37,3 +37,30 @@ class TestBoth(object):
         parser = pg.build()
 
         assert parser.parse(lexer.lex("3*4+5"))
+
+    def test_batch(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("PLUS", r"\+")
+        lg.ignore(r"\s+")
+
+        pg = ParserGenerator(["NUMBER", "PLUS"], precedence=[
+            ("left", ["PLUS"]),
+        ])
+
+        @pg.production("main : expr")
+        def main(p):
+            return p[0]
+
+        @pg.production("expr : expr PLUS expr")
+        def expr_plus(p):
+            return BoxInt(p[0].getint() + p[2].getint())
+
+        @pg.production("expr : NUMBER")
+        def expr_num(p):
+            return BoxInt(int(p[0].getstr()))
+
+        lexer = lg.build()
+        parser = pg.build()
+
+        assert parser.parse(lexer.lex_batch("1 + 2 + 39")) == BoxInt(42)
@@ -0,0 +1,172 @@
+import types
+
+from pytest import raises
+
+from rply import (
+    LexerGenerator, LexingError, ParserGenerator, ParsingError, Token
+)
+from rply.errors import ParserGeneratorError
+
+from .utils import BoxInt, ParserState, make_statements_generator
+
+
+def load_module(source):
+    module = types.ModuleType("generated")
+    exec(compile(source, "generated.py", "exec"), module.__dict__)
+    return module
+
+
+class TestParserCodegen(object):
+    def make_pg(self):
+        pg = ParserGenerator(["NUMBER", "PLUS", "TIMES"], precedence=[
+            ("left", ["PLUS"]),
+            ("left", ["TIMES"]),
+        ])
+
+        @pg.production("main : expr")
+        def main(p):
+            return p[0]
+
+        @pg.production("expr : expr PLUS expr")
+        def expr_plus(p):
+            return BoxInt(p[0].getint() + p[2].getint())
+
+        @pg.production("expr : expr TIMES expr")
+        def expr_times(p):
+            return BoxInt(p[0].getint() * p[2].getint())
+
+        @pg.production("expr : NUMBER")
+        def expr_number(p):
+            return BoxInt(int(p[0].getstr()))
+
+        return pg
+
+    def tokens(self):
+        return iter([
+            Token("NUMBER", "2"),
+            Token("PLUS", "+"),
+            Token("NUMBER", "3"),
+            Token("TIMES", "*"),
+            Token("NUMBER", "4"),
+        ])
+
+    def test_parse(self):
+        module = load_module(self.make_pg().generate_module())
+        parser = module.build(self.make_pg())
+        assert parser.parse(self.tokens()) == BoxInt(14)
+
+    def test_state(self):
+        pg = ParserGenerator(["VALUE"])
+
+        @pg.production("main : VALUE")
+        def main(state, p):
+            state.count += 1
+            return p[0]
+
+        module = load_module(pg.generate_module())
+        state = ParserState()
+        parser = module.build(pg)
+        assert parser.parse(iter([Token("VALUE", "a")]), state) == Token(
+            "VALUE", "a"
+        )
+        assert state.count == 1
+
+    def test_parse_error(self):
+        module = load_module(self.make_pg().generate_module())
+        parser = module.build(self.make_pg())
+        with raises(ParsingError):
+            parser.parse(iter([Token("PLUS", "+")]))
+
+    def test_error_recovery(self):
+        module = load_module(make_statements_generator().generate_module())
+        parser = module.build(make_statements_generator())
+        errors = []
+        assert parser.parse(iter([
+            Token("NUMBER", "1"),
+            Token("NUMBER", "2"),
+            Token("PLUS", "+"),
+            Token("SEMI", ";"),
+            Token("NUMBER", "3"),
+            Token("SEMI", ";"),
+        ]), errors=errors) == [Token("error", "2"), Token("NUMBER", "3")]
+        assert len(errors) == 1
+        errors = []
+        assert parser.parse(iter([
+            Token("NUMBER", "1"),
+            Token("PLUS", "+"),
+            Token("PLUS", "+"),
+            Token("SEMI", ";"),
+            Token("SEMI", ";"),
+        ]), errors=errors) == [Token("error", "+"), Token("error", "+")]
+        assert len(errors) == 1
+
+    def test_grammar_mismatch(self):
+        module = load_module(self.make_pg().generate_module())
+        pg = self.make_pg()
+
+        @pg.production("expr : NUMBER NUMBER")
+        def expr_numbers(p):
+            pass
+
+        with raises(ParserGeneratorError):
+            module.build(pg)
+
+
+class TestLexerCodegen(object):
+    def tokens(self, stream):
+        return [
+            (t.name, t.value, t.source_pos.idx, t.source_pos.lineno,
+             t.source_pos.colno)
+            for t in stream
+        ]
+
+    def test_dfa(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("NAME", r"[a-z]+")
+        lg.add("PLUS", r"\+")
+        lg.ignore(r"\s+")
+        source = lg.generate_module()
+        assert "TRANSITIONS" in source
+
+        module = load_module(source)
+        s = u"12 + ab\n  3+x\u1234y"
+        expected = self.tokens(lg.build().lex(s.replace(u"\u1234", u" ")))
+        with raises(LexingError) as excinfo:
+            self.tokens(module.lex(s))
+        assert excinfo.value.getsourcepos().idx == 13
+        assert self.tokens(module.lex(s.replace(u"\u1234", u" "))) == expected
+
+    def test_regex(self):
+        lg = LexerGenerator()
+        lg.add("A", r"a(?=b)")
+        lg.add("B", r"b")
+        lg.ignore(r"\s+")
+        source = lg.generate_module()
+        assert "TRANSITIONS" not in source
+
+        module = load_module(source)
+        s = "ab b\n ab"
+        assert self.tokens(module.lex(s)) == self.tokens(lg.build().lex(s))
+
+    def test_bytes(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", br"\d+")
+        lg.ignore(br"\s+")
+        module = load_module(lg.generate_module())
+        assert self.tokens(module.lex(b"1\n 23")) == [
+            ("NUMBER", b"1", 0, 1, 1),
+            ("NUMBER", b"23", 3, 2, 2),
+        ]
+
+    def test_error(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.ignore(r"\s+")
+        module = load_module(lg.generate_module())
+        stream = module.lex("1\n ?")
+        assert next(stream).getstr() == "1"
+        with raises(LexingError) as excinfo:
+            next(stream)
+        assert excinfo.value.getsourcepos().idx == 3
+        assert excinfo.value.getsourcepos().lineno == 2
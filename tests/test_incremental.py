@@ -0,0 +1,130 @@
+from pytest import raises
+
+from rply import ParsingError
+
+from .utils import build_statements_lexer, make_statements_generator
+
+
+def positions(tokens):
+    return [
+        (
+            t.gettokentype(), t.getstr(), t.getsourcepos().idx,
+            t.getsourcepos().lineno, t.getsourcepos().colno
+        )
+        for t in tokens
+    ]
+
+
+def values(result):
+    return [t.getstr() for t in result]
+
+
+class TestIncrementalParse(object):
+    source = "1 + 1 ;\n2 + 2 ;\n3 + 3 ;\n4 + 4 ;\n"
+
+    def build(self, calls=None):
+        return make_statements_generator(calls).build()
+
+    def check_edit(self, start, end, new_text, reuse_moved=False):
+        lexer = build_statements_lexer()
+        calls = []
+        parser = self.build(calls)
+        parse = parser.parse_incremental(
+            lexer, self.source, reuse_moved=reuse_moved
+        )
+        del calls[:]
+        edited = parse.edit(start, end, new_text)
+        calls = values(calls)
+
+        source = self.source[:start] + new_text + self.source[end:]
+        expected = parser.parse_incremental(lexer, source)
+        assert edited.source == source
+        assert positions(edited.tokens) == positions(expected.tokens)
+        assert edited.result == expected.result
+        return edited, calls
+
+    def test_parse(self):
+        parse = self.build().parse_incremental(
+            build_statements_lexer(), self.source
+        )
+        assert values(parse.result) == ["2", "4", "6", "8"]
+        assert len(parse.tokens) == 16
+        assert parse.errors == []
+
+    def test_edit_within_token(self):
+        edited, calls = self.check_edit(12, 13, "7")
+        assert values(edited.result) == ["2", "9", "6", "8"]
+        # Only the edited statement is reduced again.
+        assert calls == ["9"]
+
+    def test_insert_lines(self):
+        edited, calls = self.check_edit(8, 8, "10 ;\n11 ;\n")
+        assert values(edited.result) == ["2", "10", "11", "4", "6", "8"]
+        # Lexing starts again at the token before the edit, so the statement
+        # ending with it is reduced again, as are the ones that moved.
+        assert calls == ["2", "10", "11", "4", "6", "8"]
+
+    def test_reuse_moved(self):
+        edited, calls = self.check_edit(
+            8, 8, "10 ;\n11 ;\n", reuse_moved=True
+        )
+        assert calls == ["2", "10", "11"]
+
+    def test_reused(self):
+        # Only the list of statements before the edit is reused, the ones
+        # after the edited statement are parsed again, since they moved.
+        edited, calls = self.check_edit(12, 13, "77")
+        assert calls == ["79", "6", "8"]
+        assert edited.reused == 1
+
+        edited, calls = self.check_edit(12, 13, "77", reuse_moved=True)
+        assert calls == ["79"]
+        assert edited.reused == 3
+
+        # The same happens if the statements after the edit didn't move.
+        edited, calls = self.check_edit(12, 13, "7")
+        assert edited.reused == 3
+
+    def test_delete(self):
+        edited, calls = self.check_edit(0, 8, "")
+        assert values(edited.result) == ["4", "6", "8"]
+
+    def test_join_tokens(self):
+        edited, calls = self.check_edit(1, 4, "")
+        assert values(edited.result) == ["11", "4", "6", "8"]
+        assert edited.errors == []
+
+    def test_moved_positions(self):
+        parser = self.build()
+        parse = parser.parse_incremental(build_statements_lexer(), self.source)
+        edited = parse.edit(0, 0, "  ")
+        assert [t.getsourcepos().idx for t in edited.result] == [2, 10, 18, 26]
+
+    def test_errors(self):
+        parser = self.build()
+        parse = parser.parse_incremental(build_statements_lexer(), self.source)
+        broken = parse.edit(6, 7, "")
+        assert len(broken.errors) == 1
+        assert broken.errors[0].getsourcepos().idx == 7
+        assert broken.result[0].gettokentype() == "error"
+        fixed = broken.edit(6, 6, ";")
+        assert fixed.errors == []
+        assert fixed.result == parse.result
+
+        with raises(ParsingError):
+            parse.edit(0, len(self.source), "+")
+
+    def test_previous_parse_unchanged(self):
+        parser = self.build()
+        parse = parser.parse_incremental(build_statements_lexer(), self.source)
+        tokens = positions(parse.tokens)
+        parse.edit(0, 0, "5 ;\n").edit(0, 4, "")
+        assert positions(parse.tokens) == tokens
+        assert values(parse.edit(12, 13, "9").result)[1] == "11"
+
+    def test_out_of_range(self):
+        parse = self.build().parse_incremental(build_statements_lexer(), "1 ;")
+        with raises(ValueError):
+            parse.edit(2, 5, "")
+        with raises(ValueError):
+            parse.edit(2, 1, "")
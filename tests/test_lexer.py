@@ -1,8 +1,11 @@
+import io
 import re
 
 from pytest import raises
 
-from rply import LexerGenerator, LexingError
+from rply import LexerGenerator, LexingError, Token
+from rply.errors import LexerGeneratorError
+from rply.lexer import DFALexer
 
 
 class TestLexer(object):
@@ -177,3 +180,552 @@ class TestLexer(object):
             stream.next()
 
         assert excinfo.value.source_pos.colno == 4
+
+
+class TestCombinedLexer(object):
+    def test_simple(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("PLUS", r"\+")
+        lg.ignore(r"\s+")
+
+        l = lg.build(combined=True)
+
+        stream = l.lex("2 +\n    37")
+        t = stream.next()
+        assert t.name == "NUMBER"
+        assert t.value == "2"
+        t = stream.next()
+        assert t.name == "PLUS"
+        assert t.source_pos.colno == 3
+        t = stream.next()
+        assert t.name == "NUMBER"
+        assert t.value == "37"
+        assert t.source_pos.idx == 8
+        assert t.source_pos.lineno == 2
+        assert t.source_pos.colno == 5
+
+        with raises(StopIteration):
+            stream.next()
+
+    def test_first_rule_wins(self):
+        lg = LexerGenerator()
+        lg.add("IF", r"if")
+        lg.add("NAME", r"[a-z]+")
+        lg.ignore(r" ")
+
+        l = lg.build(combined=True)
+
+        assert [t.name for t in l.lex("if iffy")] == ["IF", "IF", "NAME"]
+
+    def test_mixed_flags(self):
+        lg = LexerGenerator()
+        lg.add("ALL", r"a.*", re.DOTALL)
+        lg.add("B", r"b")
+        lg.add("REF", r"(c)\1")
+        lg.add("NAMED", r"(?P<x>d)(?P=x)")
+
+        l = lg.build(combined=True)
+
+        assert len(l.patterns) == 4
+        assert [(t.name, t.value) for t in l.lex("bccddbb")] == [
+            ("B", "b"), ("REF", "cc"), ("NAMED", "dd"), ("B", "b"),
+            ("B", "b"),
+        ]
+        assert [t.value for t in l.lex("ba\nb")] == ["b", "a\nb"]
+
+    def test_error(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("PLUS", r"\+")
+        l = lg.build(combined=True)
+
+        stream = l.lex("1+2+fail")
+        for _ in range(4):
+            stream.next()
+        with raises(LexingError) as excinfo:
+            stream.next()
+
+        assert excinfo.value.source_pos.idx == 4
+        assert excinfo.value.source_pos.colno == 4
+
+
+class TestFirstCharDispatch(object):
+    def test_may_start_with(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("STRING", r'"[^"]*"')
+        lg.add("NAME", r"(?:[a-z_]|\$)\w*", re.IGNORECASE)
+        lg.add("MAYBE", r"x?y")
+        lg.add("BRANCH", r"(?:a|b?)c")
+        lg.add("DOT", r".")
+        lg.add("EMPTY", r"z*")
+
+        number, string, name, maybe, branch, dot, empty = lg.rules
+        assert number.may_start_with("7")
+        assert not number.may_start_with("a")
+        assert string.may_start_with('"')
+        assert not string.may_start_with("'")
+        assert name.may_start_with("Q")
+        assert name.may_start_with("$")
+        assert not name.may_start_with("1")
+        assert maybe.may_start_with("x")
+        assert maybe.may_start_with("y")
+        assert not maybe.may_start_with("z")
+        assert branch.may_start_with("c")
+        assert not branch.may_start_with("d")
+        assert dot.may_start_with("\n")
+        assert empty.may_start_with("\n")
+
+    def test_dispatch(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("NAME", r"\w+")
+        lg.add("OTHER", r".")
+        lg.ignore(r"\s+")
+
+        l = lg.build()
+        number, name, other = lg.rules
+        assert l.rule_table[ord("1")] == [number, name, other]
+        assert l.rule_table[ord("a")] == [name, other]
+        assert l.rule_table[ord("+")] == [other]
+        assert l.ignore_table[ord("+")] == []
+
+        assert [(t.name, t.value) for t in l.lex(u"12 ab +\u20ac\xe9")] == [
+            ("NUMBER", "12"), ("NAME", "ab"), ("OTHER", "+"),
+            ("OTHER", u"\u20ac"), ("NAME", u"\xe9"),
+        ]
+
+    def test_inline_flags(self):
+        lg = LexerGenerator()
+        lg.add("KW", r"(?i)select")
+        lg.ignore(r"\s+")
+
+        l = lg.build()
+        assert lg.rules[0].may_start_with("S")
+        assert [(t.name, t.value) for t in l.lex("SELECT select")] == [
+            ("KW", "SELECT"), ("KW", "select"),
+        ]
+
+
+class TestDFALexer(object):
+    def test_simple(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("PLUS", r"\+")
+        lg.ignore(r"\s+")
+
+        l = lg.build(dfa=True)
+        assert isinstance(l, DFALexer)
+
+        stream = l.lex("2 +\n    37")
+        t = stream.next()
+        assert t.name == "NUMBER"
+        assert t.value == "2"
+        t = stream.next()
+        assert t.name == "PLUS"
+        assert t.source_pos.colno == 3
+        t = stream.next()
+        assert t.name == "NUMBER"
+        assert t.value == "37"
+        assert t.source_pos.lineno == 2
+        assert t.source_pos.colno == 5
+
+        with raises(StopIteration):
+            stream.next()
+
+    def test_matches_like_re(self):
+        lg = LexerGenerator()
+        lg.add("IF", r"if")
+        lg.add("ALT", r"(a|ab)(c|bcd)?")
+        lg.add("LAZY", r"x+?y*?")
+        lg.add("COUNT", r"q{2,3}")
+        lg.add("NAME", r"[a-z]+")
+        lg.add("WORD", r"(?i:[A-Z])\w*")
+        lg.ignore(r"\s+")
+
+        l = lg.build(dfa=True)
+        assert isinstance(l, DFALexer)
+
+        source = "iffy abcd abc xxyy qqqqq Hello"
+        assert [(t.name, t.value) for t in l.lex(source)] == [
+            (t.name, t.value) for t in lg.build().lex(source)
+        ] == [
+            ("IF", "if"), ("NAME", "fy"), ("ALT", "abcd"), ("ALT", "a"),
+            ("NAME", "bc"), ("LAZY", "x"), ("LAZY", "x"), ("NAME", "yy"),
+            ("COUNT", "qqq"), ("COUNT", "qq"), ("WORD", "Hello"),
+        ]
+
+    def test_non_latin1(self):
+        lg = LexerGenerator()
+        lg.add("NAME", r"\w+")
+        lg.ignore(r"\s+")
+
+        l = lg.build(dfa=True)
+        assert [t.value for t in l.lex(u"abc d\u0101e f")] == [
+            "abc", u"d\u0101e", "f"
+        ]
+
+    def test_error(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("PLUS", r"\+")
+        l = lg.build(dfa=True)
+
+        stream = l.lex("1+2+fail")
+        for _ in range(4):
+            stream.next()
+        with raises(LexingError) as excinfo:
+            stream.next()
+
+        assert excinfo.value.source_pos.idx == 4
+        assert excinfo.value.source_pos.colno == 4
+
+    def test_unsupported(self):
+        lg = LexerGenerator()
+        lg.add("NAME", r"\w+")
+        lg.add("WORD", r"\bx")
+
+        with raises(LexerGeneratorError) as excinfo:
+            DFALexer(lg.rules, lg.ignore_rules)
+        assert "anchors are not supported" in str(excinfo.value)
+
+        l = lg.build(dfa=True)
+        assert not isinstance(l, DFALexer)
+        assert [t.value for t in l.lex("abc")] == ["abc"]
+
+
+class TestLazyPositions(object):
+    def test_positions(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("PLUS", r"\+")
+        lg.add("NEWLINE", r"\n")
+        lg.ignore(r" +")
+
+        source = "2 +\n    37\n\n+ 1"
+        expected = [
+            (t.name, t.value, t.source_pos.idx, t.source_pos.lineno,
+             t.source_pos.colno)
+            for t in lg.build().lex(source)
+        ]
+        for kwargs in [{}, {"combined": True}, {"dfa": True}]:
+            l = lg.build(lazy_positions=True, **kwargs)
+            tokens = list(l.lex(source))
+            assert [
+                (t.name, t.value, t.getsourcepos().idx,
+                 t.getsourcepos().lineno, t.getsourcepos().colno)
+                for t in tokens
+            ] == expected
+
+    def test_error(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.ignore(r"\s+")
+        l = lg.build(lazy_positions=True)
+
+        stream = l.lex("1\n 2 fail")
+        stream.next()
+        stream.next()
+        with raises(LexingError) as excinfo:
+            stream.next()
+
+        assert excinfo.value.source_pos.idx == 5
+        assert excinfo.value.source_pos.lineno == 2
+        assert excinfo.value.source_pos.colno == 4
+
+
+class TestLexBatch(object):
+    def test_batch(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("PLUS", r"\+")
+        lg.add("NUMBER", r"#\d+")
+        lg.ignore(r"\s+")
+
+        for kwargs in [{}, {"combined": True}, {"dfa": True}]:
+            l = lg.build(**kwargs)
+            batch = l.lex_batch("1 +\n #23")
+
+            assert len(batch) == 3
+            assert l.token_names == ["NUMBER", "PLUS"]
+            assert list(batch.types) == [0, 1, 0]
+            assert list(batch.starts) == [0, 2, 5]
+            assert list(batch.ends) == [1, 3, 8]
+            assert batch.gettokentype(2) == "NUMBER"
+            assert batch.getstr(2) == "#23"
+            assert batch.getsourcepos(2).lineno == 2
+            assert batch.getsourcepos(2).colno == 2
+            assert list(batch) == [
+                Token("NUMBER", "1"), Token("PLUS", "+"),
+                Token("NUMBER", "#23"),
+            ]
+            assert batch[1].getsourcepos().idx == 2
+
+    def test_error(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.ignore(r"\s+")
+        l = lg.build()
+
+        with raises(LexingError) as excinfo:
+            l.lex_batch("1\n 2 fail")
+        assert excinfo.value.source_pos.lineno == 2
+        assert excinfo.value.source_pos.colno == 4
+
+
+class TestBinaryInput(object):
+    def build(self, **kwargs):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("NAME", r"[a-z]\w*")
+        lg.add("PLUS", r"\+")
+        lg.ignore(r"\s+")
+        return lg.build(**kwargs)
+
+    def test_bytes(self):
+        for kwargs in [{}, {"combined": True}, {"dfa": True}]:
+            l = self.build(**kwargs)
+            for source in [b"ab + 1\n  2", bytearray(b"ab + 1\n  2")]:
+                tokens = list(l.lex(source))
+                assert [(t.name, bytes(t.value)) for t in tokens] == [
+                    ("NAME", b"ab"), ("PLUS", b"+"), ("NUMBER", b"1"),
+                    ("NUMBER", b"2"),
+                ]
+                pos = tokens[-1].getsourcepos()
+                assert (pos.idx, pos.lineno, pos.colno) == (9, 2, 3)
+
+    def test_memoryview(self):
+        source = bytearray(b"12 + 3")
+        tokens = list(self.build().lex(memoryview(source)))
+        assert isinstance(tokens[0].value, memoryview)
+        source[0:1] = b"9"
+        assert tokens[0].value == b"92"
+
+    def test_mmap(self, tmpdir):
+        import mmap
+
+        path = tmpdir.join("source")
+        path.write_binary(b"1 +\nab")
+        with path.open("rb") as f:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                batch = self.build().lex_batch(source)
+                assert [batch.getstr(i) for i in range(len(batch))] == [
+                    b"1", b"+", b"ab"
+                ]
+                assert batch.getsourcepos(2).lineno == 2
+            finally:
+                source.close()
+
+    def test_error(self):
+        with raises(LexingError) as excinfo:
+            list(self.build().lex(b"1\n 2 !"))
+        assert excinfo.value.source_pos.lineno == 2
+        assert excinfo.value.source_pos.colno == 4
+
+    def test_non_ascii_pattern(self):
+        lg = LexerGenerator()
+        lg.add("E", u"\xe9")
+        l = lg.build()
+        with raises(LexerGeneratorError):
+            l.lex(b"\xc3\xa9")
+
+
+class TestLexStream(object):
+    def build(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("NAME", r"[a-z]+")
+        lg.add("PLUS", r"\+")
+        lg.ignore(r"\s+")
+        lg.ignore(r"#[^\n]*")
+        return lg.build()
+
+    def tokens(self, stream):
+        return [
+            (t.name, t.value, t.source_pos.idx, t.source_pos.lineno,
+             t.source_pos.colno)
+            for t in stream
+        ]
+
+    def test_same_as_lex(self):
+        l = self.build()
+        s = u"12 + abc # comment\n  345+\n\n  xyz #\n6"
+        expected = self.tokens(l.lex(s))
+        for chunk_size in [1, 2, 3, 5, 100]:
+            stream = l.lex_stream(io.StringIO(s), chunk_size=chunk_size)
+            assert self.tokens(stream) == expected
+
+    def test_lookahead_after_ignored(self):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+(\.\d+)?")
+        lg.add("DOT", r"\.")
+        lg.ignore(r"\s+")
+        l = lg.build()
+
+        stream = l.lex_stream(io.StringIO(u" " * 998 + u"2.5"), 1000)
+        assert [(t.name, t.value) for t in stream] == [("NUMBER", u"2.5")]
+
+        s = u"1234567.5"
+        stream = l.lex_stream(io.StringIO(s), chunk_size=8)
+        assert self.tokens(stream) == self.tokens(l.lex(s))
+
+    def test_token_across_chunks(self):
+        l = self.build()
+        stream = l.lex_stream(io.StringIO(u"123456789+abcdefgh"), 4)
+        assert [t.getstr() for t in stream] == [
+            u"123456789", u"+", u"abcdefgh"
+        ]
+
+    def test_bytes(self):
+        l = self.build()
+        stream = l.lex_stream(io.BytesIO(b"1 +\nab"), chunk_size=2)
+        assert self.tokens(stream) == [
+            ("NUMBER", b"1", 0, 1, 1),
+            ("PLUS", b"+", 2, 1, 3),
+            ("NAME", b"ab", 4, 2, 1),
+        ]
+
+    def test_empty(self):
+        l = self.build()
+        assert list(l.lex_stream(io.StringIO(u""))) == []
+        assert list(l.lex_stream(io.StringIO(u"  # x"), chunk_size=1)) == []
+
+    def test_error(self):
+        l = self.build()
+        stream = l.lex_stream(io.StringIO(u"1 +\n  2 !"), chunk_size=2)
+        assert next(stream).getstr() == u"1"
+        assert next(stream).getstr() == u"+"
+        assert next(stream).getstr() == u"2"
+        with raises(LexingError) as excinfo:
+            next(stream)
+        assert excinfo.value.source_pos.idx == 8
+        assert excinfo.value.source_pos.lineno == 2
+
+
+class TestRelex(object):
+    def build(self, **kwargs):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("NAME", r"[a-z]+")
+        lg.add("STRING", r'"[^"\n]*"')
+        lg.add("PLUS", r"\+")
+        lg.ignore(r"\s+")
+        return lg.build(**kwargs)
+
+    def tokens(self, tokens):
+        return [
+            (t.gettokentype(), t.getstr(), t.getsourcepos().idx,
+             t.getsourcepos().lineno, t.getsourcepos().colno)
+            for t in tokens
+        ]
+
+    def check(self, l, source, start, end, new_text):
+        old_tokens = list(l.lex(source))
+        expected = self.tokens(old_tokens)
+        new_source = source[:start] + new_text + source[end:]
+        tokens = l.relex(old_tokens, new_source, start, end, new_text)
+        assert self.tokens(tokens) == self.tokens(l.lex(new_source))
+        assert self.tokens(old_tokens) == expected
+        return old_tokens, tokens
+
+    def test_edits(self):
+        source = 'ab + 12\n  "x + y" + cd\nef 3 + 4\n'
+        edits = [
+            (0, 0, "z"), (2, 2, " "), (1, 6, ""), (5, 7, "345\n\n"),
+            (10, 10, '"" + '), (12, 13, "+"), (22, 23, ""), (8, 8, "q + "),
+            (len(source), len(source), "5"), (0, len(source), ""),
+        ]
+        for kwargs in [{}, {"combined": True}, {"dfa": True},
+                       {"lazy_positions": True}]:
+            l = self.build(**kwargs)
+            for start, end, new_text in edits:
+                self.check(l, source, start, end, new_text)
+
+    def test_reuses_tokens(self):
+        l = self.build()
+        old_tokens, tokens = self.check(l, "a + 1\nb + 2\n", 4, 5, "7")
+        assert tokens[:2] == old_tokens[:2]
+        assert tokens[4:] == old_tokens[4:]
+        assert all(t is o for t, o in zip(tokens[4:], old_tokens[4:]))
+
+    def test_shares_line_index(self):
+        l = self.build(lazy_positions=True)
+        source = "a + 1\nb + 2\nc + 3\n"
+        old_tokens = list(l.lex(source))
+        self.tokens(old_tokens)
+        source = source[:4] + "10\n" + source[5:]
+        tokens = l.relex(old_tokens, source, 4, 5, "10\n")
+        # The old index is moved instead of searching the source again.
+        index = tokens[-1].line_index
+        assert index.s is source
+        assert index.line_starts == [0, 7, 8, 14, 20]
+        assert all(t.line_index is index for t in tokens[1:])
+        assert self.tokens(tokens) == self.tokens(l.lex(source))
+
+        # Tokens after a same-length edit aren't moved, so they keep the
+        # index of the source before it.
+        source = "d" + source[1:]
+        tokens = l.relex(tokens, source, 0, 1, "d")
+        assert tokens[-1].line_index is index
+        tokens = l.relex(tokens, source + "e", len(source), len(source), "e")
+        assert self.tokens(tokens) == self.tokens(l.lex(source + "e"))
+
+    def test_bytes(self):
+        l = self.build()
+        self.check(l, b"a + 1\nb + 2\n", 2, 3, b"\n")
+
+    def test_error(self):
+        l = self.build()
+        old_tokens = list(l.lex("a + 1"))
+        with raises(LexingError):
+            l.relex(old_tokens, "a ! 1", 2, 3, "!")
+        with raises(ValueError):
+            l.relex(old_tokens, "a + 1", 3, 2, "")
+
+
+class TestLexParallel(object):
+    def build(self, **kwargs):
+        lg = LexerGenerator()
+        lg.add("NUMBER", r"\d+")
+        lg.add("NAME", r"[a-z]+")
+        lg.add("STRING", r'"""[\s\S]*?"""|"[^"\n]*"')
+        lg.add("PLUS", r"\+")
+        lg.ignore(r"\s+")
+        return lg.build(**kwargs)
+
+    def arrays(self, batch):
+        return list(batch.types), list(batch.starts), list(batch.ends)
+
+    def test_same_as_batch(self):
+        s = u'a + 1\n"""b\n+ c\n"""\nd + "e"\n\n"""\n"""\nf\n' * 20
+        for kwargs in [{}, {"combined": True}, {"dfa": True}]:
+            l = self.build(**kwargs)
+            expected = self.arrays(l.lex_batch(s))
+            for chunk_size in [1, 7, 50]:
+                for no_split in [None, r'"""[\s\S]*?"""']:
+                    batch = l.lex_parallel(
+                        s, workers=2, chunk_size=chunk_size,
+                        no_split=no_split
+                    )
+                    assert self.arrays(batch) == expected
+
+    def test_positions(self):
+        l = self.build()
+        batch = l.lex_parallel(u"a\n+\n12 +\n  b", workers=2, chunk_size=2)
+        assert [t.getstr() for t in batch] == [u"a", u"+", u"12", u"+", u"b"]
+        pos = batch.getsourcepos(4)
+        assert (pos.idx, pos.lineno, pos.colno) == (11, 4, 3)
+
+    def test_bytes(self):
+        l = self.build()
+        batch = l.lex_parallel(b"a\n+ 1\n", workers=2, chunk_size=2)
+        assert [t.getstr() for t in batch] == [b"a", b"+", b"1"]
+
+    def test_error(self):
+        l = self.build()
+        with raises(LexingError) as excinfo:
+            l.lex_parallel(u"a\n+\n!\nb\n", workers=2, chunk_size=2)
+        assert excinfo.value.source_pos.idx == 4
+        assert excinfo.value.source_pos.lineno == 3
@@ -1,13 +1,19 @@
 import operator
+import os
 
 import py
 
-from rply import ParserGenerator, ParsingError, Token
+from pytest import mark, raises
+
+from rply import LexingError, ParserGenerator, ParsingError, Token
 from rply.errors import ParserGeneratorWarning
 from rply.token import SourcePosition
 
 from .base import BaseTests
-from .utils import BoxInt, ParserState, RecordingLexer
+from .utils import (
+    BoxInt, ParserState, RecordingLexer, build_statements_lexer,
+    make_statements_generator
+)
 
 
 class TestParser(BaseTests):
@@ -288,3 +294,207 @@ class TestParser(BaseTests):
             "token:None",
             "main",
         ]
+
+
+class TestParserSession(object):
+    def build(self):
+        pg = ParserGenerator(["NUMBER", "PLUS"], precedence=[
+            ("left", ["PLUS"]),
+        ])
+
+        @pg.production("main : expression")
+        def main(p):
+            return p[0]
+
+        @pg.production("expression : expression PLUS expression")
+        def expression_plus(p):
+            return BoxInt(p[0].getint() + p[2].getint())
+
+        @pg.production("expression : NUMBER")
+        def expression_number(p):
+            return BoxInt(int(p[0].getstr()))
+
+        return pg.build()
+
+    def test_feed(self):
+        parser = self.build()
+        session = parser.start()
+        session.feed(Token("NUMBER", "1"))
+        session.feed(Token("PLUS", "+"))
+        session.feed(Token("NUMBER", "2"))
+        assert session.finish() == BoxInt(3)
+        assert session.finish() == BoxInt(3)
+
+    def test_interleaved(self):
+        parser = self.build()
+        sessions = [parser.start() for _ in range(3)]
+        for i, session in enumerate(sessions):
+            session.feed(Token("NUMBER", str(i)))
+        for session in sessions:
+            session.feed(Token("PLUS", "+"))
+        for session in sessions:
+            session.feed(Token("NUMBER", "10"))
+        assert [s.finish() for s in sessions] == [
+            BoxInt(10), BoxInt(11), BoxInt(12)
+        ]
+
+    def test_state(self):
+        pg = ParserGenerator(["VALUE"])
+
+        @pg.production("main : VALUE")
+        def main(state, p):
+            state.count += 1
+            return p[0]
+
+        parser = pg.build()
+        state = ParserState()
+        session = parser.start(state)
+        session.feed(Token("VALUE", "a"))
+        assert session.finish() == Token("VALUE", "a")
+        assert state.count == 1
+
+    def test_error(self):
+        parser = self.build()
+        session = parser.start()
+        session.feed(Token("NUMBER", "1"))
+        with raises(ParsingError):
+            session.feed(Token("NUMBER", "2", SourcePosition(2, 1, 3)))
+
+    def test_feed_after_finish(self):
+        parser = self.build()
+        session = parser.start()
+        session.feed(Token("NUMBER", "1"))
+        session.finish()
+        with raises(ValueError):
+            session.feed(Token("NUMBER", "2"))
+
+
+class TestErrorRecovery(object):
+    def build(self, error_handler=None):
+        pg = make_statements_generator()
+        if error_handler is not None:
+            pg.error(error_handler)
+        return pg.build()
+
+    def tokens(self, source):
+        names = {"+": "PLUS", ";": "SEMI"}
+        return iter([
+            Token(names.get(s, "NUMBER"), s, SourcePosition(i, 1, i + 1))
+            for i, s in enumerate(source.split())
+        ])
+
+    def test_recovers(self):
+        errors = []
+        result = self.build().parse(
+            self.tokens("1 + 2 ; 3 4 5 ; 6 ;"), errors=errors
+        )
+        assert result == [
+            Token("NUMBER", "3"), Token("error", "4"), Token("NUMBER", "6")
+        ]
+        assert result[1].getsourcepos().idx == 5
+        assert [e.getsourcepos().idx for e in errors] == [5]
+
+    def test_collects_all_errors(self):
+        errors = []
+        result = self.build().parse(
+            self.tokens("1 + + ; 2 ; ; 3 ;"), errors=errors
+        )
+        assert result == [
+            Token("error", "+"), Token("NUMBER", "2"), Token("error", ";"),
+            Token("NUMBER", "3"),
+        ]
+        assert [e.getsourcepos().idx for e in errors] == [2, 6]
+
+    def test_error_after_recovery(self):
+        # Like with yacc, error is shifted again for the second ;, which
+        # isn't reported, since it follows the last error too closely.
+        errors = []
+        result = self.build().parse(self.tokens("1 + + ; ;"), errors=errors)
+        assert result == [Token("error", "+"), Token("error", "+")]
+        assert [e.getsourcepos().idx for e in errors] == [2]
+
+    def test_errors_within_three_tokens(self):
+        errors = []
+        result = self.build().parse(
+            self.tokens("1 + + ; + 2 ; 3 ;"), errors=errors
+        )
+        assert result == [
+            Token("error", "+"), Token("error", "+"), Token("NUMBER", "3")
+        ]
+        assert [e.getsourcepos().idx for e in errors] == [2]
+
+    def test_unrecoverable(self):
+        errors = []
+        with raises(ParsingError):
+            self.build().parse(self.tokens("1 ; 2 2"), errors=errors)
+        assert [e.getsourcepos().idx for e in errors] == [3]
+
+    def test_error_handler(self):
+        seen = []
+        parser = self.build(error_handler=seen.append)
+        result = parser.parse(self.tokens("1 1 ; 2 ;"))
+        assert result == [Token("error", "1"), Token("NUMBER", "2")]
+        assert seen == [Token("NUMBER", "1")]
+
+    def test_session(self):
+        session = self.build().start()
+        for token in self.tokens("; 1 ;"):
+            session.feed(token)
+        assert session.finish() == [Token("error", ";"), Token("NUMBER", "1")]
+        assert len(session.errors) == 1
+
+
+class TestParseMany(object):
+    def build(self):
+        return build_statements_lexer(), make_statements_generator().build()
+
+    sources = ["1;", "1 + 2;", "3; + 4; 5;", "1 +", "2 $", "7 + 7 + 7;"]
+
+    def check(self, results):
+        assert [result for result, _ in results] == [
+            [Token("NUMBER", "1")], [Token("NUMBER", "3")],
+            [Token("NUMBER", "3"), Token("error", "+"), Token("NUMBER", "5")],
+            None, None, [Token("NUMBER", "21")],
+        ]
+        assert results[2][0][1].getsourcepos().idx == 3
+        assert [len(errors) for _, errors in results] == [0, 0, 1, 2, 1, 0]
+        assert isinstance(results[2][1][0], ParsingError)
+        assert isinstance(results[3][1][-1], ParsingError)
+        assert isinstance(results[4][1][0], LexingError)
+
+    @mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+    def test_sources(self):
+        lexer, parser = self.build()
+        self.check(parser.parse_many(
+            self.sources, lexer=lexer, workers=2, chunksize=2
+        ))
+
+    @mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+    def test_tokens(self):
+        lexer, parser = self.build()
+        items = [list(lexer.lex(s)) for s in self.sources[:3]]
+        items.append(lexer.lex_batch(self.sources[5]))
+        results = parser.parse_many(iter(items), workers=3)
+        assert [result for result, _ in results] == [
+            [Token("NUMBER", "1")], [Token("NUMBER", "3")],
+            [Token("NUMBER", "3"), Token("error", "+"), Token("NUMBER", "5")],
+            [Token("NUMBER", "21")],
+        ]
+        assert [len(errors) for _, errors in results] == [0, 0, 1, 0]
+
+    def test_in_process(self):
+        lexer, parser = self.build()
+        self.check(parser.parse_many(self.sources, lexer=lexer, workers=1))
+
+    def test_unrecoverable(self):
+        pg = ParserGenerator(["NUMBER"])
+
+        @pg.production("main : NUMBER")
+        def main(p):
+            return p[0]
+
+        [(result, errors)] = pg.build().parse_many(
+            [[Token("NUMBER", "1"), Token("NUMBER", "2")]], workers=1
+        )
+        assert result is None
+        assert len(errors) == 1
@@ -4,6 +4,9 @@ import py
 
 from rply import ParserGenerator, Token
 from rply.errors import ParserGeneratorError
+from rply.parsergenerator import (
+    BuildProfile, LRTable, LRTableCache, MappedLRTable, pack_rows
+)
 
 from .base import BaseTests
 
@@ -84,18 +87,261 @@ class TestParserGenerator(BaseTests):
 
 
 class TestParserCaching(object):
-    def test_simple_caching(self):
+    def test_simple_caching(self, monkeypatch):
         # Generate a random cache_id so that every test run does both the cache
-        # write and read paths.
+        # write and read paths. The tables are dropped from the in-process
+        # cache, so the second build has to read them from disk.
+        monkeypatch.setattr(ParserGenerator, "table_cache", LRTableCache())
         pg = ParserGenerator(["VALUE"], cache_id=str(uuid.uuid4()))
 
         @pg.production("main : VALUE")
         def main(p):
             return p[0]
 
-        pg.build()
-        parser = pg.build()
+        profiles = []
+        pg.build(profile=profiles.append)
+        ParserGenerator.table_cache.invalidate()
+        parser = pg.build(profile=profiles.append)
+        assert profiles[0].phases["cache write"][1] == 1
+        assert profiles[1].counts["disk cache hits"] == 1
 
         assert parser.parse(iter([
             Token("VALUE", "3")
         ])) == Token("VALUE", "3")
+
+    def test_packed_table_roundtrip(self):
+        pg = ParserGenerator(["NUMBER", "PLUS"], precedence=[
+            ("left", ["PLUS"]),
+        ])
+
+        @pg.production("expr : NUMBER")
+        @pg.production("expr : expr PLUS expr")
+        @pg.production("main : expr")
+        def f(p):
+            return p[0]
+
+        table = pg.build().lr_table
+        grammar_hash = pg.compute_grammar_hash(table.grammar)
+        data = pg.serialize_packed_table(table, grammar_hash)
+
+        loaded = pg.load_packed_table(table.grammar, grammar_hash, data)
+        assert loaded.lr_action == table.lr_action
+        assert loaded.lr_goto == table.lr_goto
+        assert loaded.terminal_ids == table.terminal_ids
+        for name in LRTable.PACKED_ARRAYS:
+            assert list(getattr(loaded, name)) == list(getattr(table, name))
+
+        assert pg.load_packed_table(table.grammar, "0" * 40, data) is None
+        assert pg.load_packed_table(
+            table.grammar, grammar_hash, b"garbage"
+        ) is None
+
+
+class TestTableCache(object):
+    def make_pg(self, value):
+        pg = ParserGenerator(["VALUE"])
+
+        @pg.production("main : VALUE")
+        def main(p):
+            return value
+
+        return pg
+
+    def test_reuses_tables(self, monkeypatch):
+        monkeypatch.setattr(ParserGenerator, "table_cache", LRTableCache())
+        parser = self.make_pg(1).build()
+        assert len(ParserGenerator.table_cache) == 1
+
+        def from_grammar(grammar):
+            raise AssertionError("Table was built again")
+        monkeypatch.setattr(LRTable, "from_grammar", from_grammar)
+        cached = self.make_pg(2).build()
+        assert cached.lr_table.action_value is parser.lr_table.action_value
+        assert cached.parse(iter([Token("VALUE", "a")])) == 2
+        assert parser.parse(iter([Token("VALUE", "a")])) == 1
+
+    def test_invalidate(self, monkeypatch):
+        monkeypatch.setattr(ParserGenerator, "table_cache", LRTableCache())
+        pg = self.make_pg(1)
+        table = pg.build().lr_table
+        ParserGenerator.table_cache.invalidate(
+            pg.compute_grammar_hash(table.grammar)
+        )
+        assert len(ParserGenerator.table_cache) == 0
+        pg.build()
+        ParserGenerator.table_cache.invalidate()
+        assert len(ParserGenerator.table_cache) == 0
+
+    def test_lru(self):
+        cache = LRTableCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+
+class TestBuildProfile(object):
+    def make_pg(self):
+        pg = ParserGenerator(["VALUE"])
+
+        @pg.production("main : VALUE")
+        def main(p):
+            return p[0]
+
+        return pg
+
+    def test_callback(self, monkeypatch):
+        monkeypatch.setattr(ParserGenerator, "table_cache", LRTableCache())
+        profiles = []
+        self.make_pg().build(profile=profiles.append)
+        [profile] = profiles
+        assert isinstance(profile, BuildProfile)
+        for name in [
+            "build_lritems", "compute_first", "compute_follow", "lr0_items",
+            "compute_read_sets", "compute_lookback_includes",
+            "compute_follow_sets", "action table",
+        ]:
+            seconds, calls = profile.phases[name]
+            assert seconds >= 0
+            assert calls == 1
+        assert profile.counts["states"] == profile.counts["lr0_closure calls"]
+        assert profile.counts["productions"] == 2
+        assert "table cache hits" not in profile.counts
+
+        self.make_pg().build(profile=profiles.append)
+        assert profiles[1].counts["table cache hits"] == 1
+        assert "lr0_items" not in profiles[1].phases
+
+    def test_disk_cache(self, monkeypatch):
+        monkeypatch.setattr(ParserGenerator, "table_cache", LRTableCache())
+        profiles = []
+        pg = self.make_pg()
+        pg.cache_id = "profile-%s" % uuid.uuid4()
+        pg.build(profile=profiles.append)
+        assert profiles[0].phases["cache write"][1] == 1
+        ParserGenerator.table_cache.invalidate()
+        pg.build(profile=profiles.append)
+        assert profiles[1].phases["cache read"][1] == 1
+        assert profiles[1].counts["disk cache hits"] == 1
+        assert "lr0_items" not in profiles[1].phases
+
+    def test_report(self, capsys):
+        self.make_pg().build(profile=True)
+        _, err = capsys.readouterr()
+        assert "total" in err
+
+
+class TestMappedTables(object):
+    def make_pg(self, tokens=("NUMBER", "PLUS")):
+        pg = ParserGenerator(
+            list(tokens), precedence=[("left", list(tokens[1:]))]
+        )
+
+        @pg.production("main : expr")
+        def main(p):
+            return p[0]
+
+        @pg.production("expr : expr PLUS expr")
+        def expr_plus(p):
+            return Token("NUMBER", p[0].getstr() + p[2].getstr())
+
+        @pg.production("expr : NUMBER")
+        def expr_number(p):
+            return p[0]
+
+        return pg
+
+    def parse(self, parser):
+        return parser.parse(iter([
+            Token("NUMBER", "1"), Token("PLUS", "+"), Token("NUMBER", "2"),
+        ]))
+
+    def test_build_mapped(self, tmpdir):
+        path = str(tmpdir.join("tables"))
+        parser = self.make_pg().build_mapped(path)
+        assert isinstance(parser.lr_table, MappedLRTable)
+        assert self.parse(parser) == Token("NUMBER", "12")
+
+        with open(path, "rb") as f:
+            data = f.read()
+        parser = self.make_pg().build_mapped(path)
+        assert isinstance(parser.lr_table, MappedLRTable)
+        assert self.parse(parser) == Token("NUMBER", "12")
+        with open(path, "rb") as f:
+            assert f.read() == data
+
+    def test_tables_match(self, tmpdir):
+        table = self.make_pg().build().lr_table
+        mapped = self.make_pg().build_mapped(str(tmpdir.join("t"))).lr_table
+        assert mapped.terminal_ids == table.terminal_ids
+        for name in LRTable.PACKED_ARRAYS:
+            assert list(getattr(mapped, name)) == list(getattr(table, name))
+
+    def test_replaces_invalid_file(self, tmpdir):
+        path = tmpdir.join("tables")
+        path.write_binary(b"garbage")
+        parser = self.make_pg().build_mapped(str(path))
+        assert self.parse(parser) == Token("NUMBER", "12")
+
+        pg = self.make_pg(("NUMBER", "PLUS", "MINUS"))
+
+        @pg.production("expr : expr MINUS expr")
+        def expr_minus(p):
+            pass
+
+        parser = pg.build_mapped(str(path))
+        assert isinstance(parser.lr_table, MappedLRTable)
+        assert "MINUS" in parser.lr_table.terminal_ids
+
+
+class TestPackedTables(object):
+    def test_pack_rows(self):
+        rows = [
+            [(0, 1), (2, 3)],
+            [],
+            [(1, 5)],
+            [(0, 1), (2, 3)],
+            [(0, 7), (1, 8), (2, 9)],
+        ]
+        base, check, value = pack_rows(rows, 3)
+        assert base[0] == base[3]
+        for r, row in enumerate(rows):
+            entries = dict(row)
+            for c in range(3):
+                i = base[r] + c
+                if c in entries:
+                    assert check[i] == c
+                    assert value[i] == entries[c]
+                else:
+                    assert check[i] != c
+
+    def test_tables_match(self):
+        pg = ParserGenerator(["NUMBER", "PLUS", "TIMES"], precedence=[
+            ("left", ["PLUS"]),
+            ("left", ["TIMES"]),
+        ])
+
+        @pg.production("expr : NUMBER")
+        @pg.production("expr : expr TIMES expr")
+        @pg.production("expr : expr PLUS expr")
+        @pg.production("main : expr")
+        def f(p):
+            pass
+
+        table = pg.build().lr_table
+        for state, actions in enumerate(table.lr_action):
+            for nonterm, target in table.lr_goto[state].items():
+                i = table.goto_base[state] + table.nonterminal_ids[nonterm]
+                assert table.goto_value[i] == target
+            if table.default_reductions[state]:
+                continue
+            for term, tid in table.terminal_ids.items():
+                i = table.action_base[state] + tid
+                if term in actions:
+                    assert table.action_check[i] == tid
+                    assert table.action_value[i] == actions[term]
+                else:
+                    assert table.action_check[i] != tid
@@ -1,4 +1,4 @@
-from rply.token import SourcePosition, Token
+from rply.token import IndexedToken, LineIndex, SourcePosition, Token
 
 
 class TestTokens(object):
@@ -26,3 +26,63 @@ class TestSourcePosition(object):
     def test_repr(self):
         t = SourcePosition(1, 2, 3)
         assert repr(t) == "SourcePosition(idx=1, lineno=2, colno=3)"
+
+
+class TestIndexedToken(object):
+    def test_source_pos(self):
+        t = IndexedToken("VALUE", "3", 4, LineIndex("1\n23"))
+        assert t.getsourcepos().idx == 4
+        assert t.getsourcepos().lineno == 2
+        assert t.getsourcepos().colno == 3
+        assert t == Token("VALUE", "3")
+
+
+class TestLineIndex(object):
+    def test_getsourcepos(self):
+        s = "ab\n\ncd\ne"
+        index = LineIndex(s)
+        positions = [
+            (index.getsourcepos(i).lineno, index.getsourcepos(i).colno)
+            for i in range(len(s) + 1)
+        ]
+        assert positions == [
+            (1, 1), (1, 2), (1, 3), (2, 1), (3, 1), (3, 2), (3, 3), (4, 1),
+            (4, 2),
+        ]
+
+    def test_scans_lazily(self):
+        index = LineIndex("a\nb\nc\nd")
+        assert index.getsourcepos(2).lineno == 2
+        assert index.line_starts == [0, 2, 4]
+        assert index.getsourcepos(0).lineno == 1
+        assert index.getsourcepos(6).lineno == 4
+        assert index.line_starts == [0, 2, 4, 6]
+
+    def test_edited(self):
+        s = "ab\n\ncd\ne\nf"
+        edits = [
+            (0, 0, "x\n"), (3, 4, ""), (2, 5, "y"), (1, 1, "\n\n"),
+            (len(s), len(s), "\ng"),
+        ]
+        for start, end, new_text in edits:
+            new_s = s[:start] + new_text + s[end:]
+            for scanned in [0, start, end, len(s)]:
+                index = LineIndex(s)
+                index.getsourcepos(scanned)
+                edited = index.edited(new_s, start, end, new_text)
+                fresh = LineIndex(new_s)
+                for i in range(len(new_s) + 1):
+                    pos = edited.getsourcepos(i)
+                    expected = fresh.getsourcepos(i)
+                    assert (pos.lineno, pos.colno) == (
+                        expected.lineno, expected.colno
+                    )
+
+
+class TestSlots(object):
+    def test_no_dict(self):
+        t = Token("VALUE", "3", SourcePosition(1, 2, 3))
+        assert not hasattr(t, "__dict__")
+        assert not hasattr(t.source_pos, "__dict__")
+        t = IndexedToken("VALUE", "3", 0, LineIndex("3"))
+        assert not hasattr(t, "__dict__")
@@ -1,3 +1,4 @@
+from rply import LexerGenerator, ParserGenerator, Token
 from rply.token import BaseBox
 
 
@@ -40,3 +41,58 @@ class BoxInt(BaseBox):
 class ParserState(object):
     def __init__(self):
         self.count = 0
+
+
+def make_statements_generator(record=None):
+    """
+    Returns a ParserGenerator for statements like `1 + 2 ;`. The result is a
+    list with a NUMBER token for every statement, holding the sum and the
+    position of its first number, or the error token for statements with a
+    syntax error. If `record` is given, the token of every statement parsed
+    is appended to it.
+    """
+    pg = ParserGenerator(["NUMBER", "PLUS", "SEMI"], precedence=[
+        ("left", ["PLUS"]),
+    ])
+
+    @pg.production("main : stmts")
+    def main(p):
+        return p[0]
+
+    @pg.production("stmts : stmts stmt")
+    def stmts_stmt(p):
+        return p[0] + [p[1]]
+
+    @pg.production("stmts : stmt")
+    def stmts(p):
+        return [p[0]]
+
+    @pg.production("stmt : expr SEMI")
+    def stmt_expr(p):
+        if record is not None:
+            record.append(p[0])
+        return p[0]
+
+    @pg.production("stmt : error SEMI")
+    def stmt_error(p):
+        return p[0]
+
+    @pg.production("expr : expr PLUS expr")
+    def expr_plus(p):
+        value = int(p[0].getstr()) + int(p[2].getstr())
+        return Token("NUMBER", str(value), p[0].getsourcepos())
+
+    @pg.production("expr : NUMBER")
+    def expr_number(p):
+        return p[0]
+
+    return pg
+
+
+def build_statements_lexer():
+    lg = LexerGenerator()
+    lg.add("NUMBER", r"\d+")
+    lg.add("PLUS", r"\+")
+    lg.add("SEMI", r";")
+    lg.ignore(r"\s+")
+    return lg.build()